@@ -1,69 +1,153 @@
 import math
-import collections
+import array
+from NgramStore import np, sortedTable, lookupTable, withUnknown, pruneTable
+from BigramModel import BigramModel
 
 
-class BackoffModel:
+class BackoffModel(BigramModel):
+    """Bigram model that backs off to discounted unigram probabilities for unseen bigrams."""
 
-    def __init__(self, corpus):
-        """Initialize your data structures in the constructor."""
-        self.unigramCounts = collections.defaultdict(lambda: 1)
-        self.bigramCounts = collections.defaultdict(lambda: 0)
-        self.total = 0
-        self.train(corpus)
+    def finalize(self):
+        """ Precomputes log-probabilities of the seen bigrams and the discounted unigram
+            log-probabilities used for unseen ones, so scoring is a table lookup. Must be
+            called again after train().
+        """
+        counts = self.counts
+        self.buildBackoffLogProbs()
+        # log-weights of the unseen bigrams per context, nonzero only in pruned contexts
+        self.contextWeights = array.array('d', [0.0]) * len(counts.unigramCounts)
+        self.bigramLogProbs = {}
+        for key, count in counts.bigramCounts.iteritems():
+            prevId = counts.splitBigramKey(key)[0]
+            self.bigramLogProbs[key] = math.log(count) - \
+                math.log(counts.unigramCounts[prevId] + 1)
+        if self.cutoff:
+            self.pruneBigrams()
+        self.compactTable()
 
-    def train(self, corpus):
-        """ Takes a corpus and trains your language model.
-            Compute any counts or other corpus statistics in this function.
+    def pruneBigrams(self):
+        """ Prunes the bigram table to self.cutoff, moving the probability of the pruned
+            bigrams of each context to its unseen bigrams through contextWeights.
         """
-        for sentence in corpus.corpus:
-            prev = " "
-            for datum in sentence.data:
-                self.total += 1
-                token = datum.word
-                self.unigramCounts[token] += 1
-                bigram = "%s %s" % (prev, token)
-                self.bigramCounts[bigram] += 1
-                prev = token
+        counts = self.counts
+        backoffProbs = [math.exp(logProb) for logProb in self.backoffLogProbs]
+        backoffMass = sum(backoffProbs)
+
+        def unseenMasses(prevId, seenIds, prunedIds):
+            return backoffMass - sum(backoffProbs[tokenId] for tokenId in seenIds), \
+                sum(backoffProbs[tokenId] for tokenId in prunedIds)
 
-        self.bigramCounts["UNK"] = 0
-        self.unigramCounts["UNK"] = 1
+        self.bigramLogProbs, weights = pruneTable(counts, self.bigramLogProbs, self.cutoff,
+                                                  unseenMasses)
+        for prevId, weight in weights.iteritems():
+            self.contextWeights[prevId] = weight
 
-        # count = 0
-        # for data in self.unigramCounts:
-        #     count += 1
+    def buildBackoffLogProbs(self):
+        """ Computes the discounted unigram log-probabilities used for unseen bigrams. """
+        counts = self.counts
+        # unigram counts are add-one smoothed, with one extra type for unseen words
+        # discount = 0.3
+        discount = 0.4
+        backoffWeight = math.log(discount) - \
+            math.log(counts.total + counts.unigramTypes + 1)
+        self.backoffLogProbs = array.array('d')
+        for count in counts.unigramCounts:
+            self.backoffLogProbs.append(math.log(count + 1) + backoffWeight)
+        self.unknownLogProb = math.log(1) + backoffWeight
 
-        # print("count is " + str(count))
+    def refreshContexts(self, contexts):
+        """ The unigram log-probabilities all depend on the total, so they are recomputed
+            (one pass over the vocabulary); seen bigrams only in the given contexts.
+        """
+        counts = self.counts
+        self.buildBackoffLogProbs()
+        # not compacted, so every context weight is zero
+        self.contextWeights.extend([0.0] * (len(self.backoffLogProbs) - len(self.contextWeights)))
+        maxBackoff = max(max(self.backoffLogProbs), self.unknownLogProb)
+        for wordId in xrange(len(self.backoffLogProbs)):
+            if wordId == len(self.maxFollowing):
+                self.maxFollowing.append(maxBackoff)
+                self.maxPreceding.append(self.backoffLogProbs[wordId])
+            self.maxFollowing[wordId] = max(self.maxFollowing[wordId], maxBackoff)
+            self.maxPreceding[wordId] = max(self.maxPreceding[wordId], self.backoffLogProbs[wordId])
+        self.unknownFollowing = max(self.unknownFollowing, maxBackoff)
+        self.unknownPreceding = self.unknownLogProb
+        for prevId in contexts:
+            maxFollowing = maxBackoff
+            for tokenId in counts.followers[prevId]:
+                key = counts.bigramKey(prevId, tokenId)
+                logProb = math.log(counts.bigramCounts[key]) - \
+                    math.log(counts.unigramCounts[prevId] + 1)
+                self.bigramLogProbs[key] = logProb
+                maxFollowing = max(maxFollowing, logProb)
+                if logProb > self.maxPreceding[tokenId]:
+                    self.maxPreceding[tokenId] = logProb
+            self.maxFollowing[prevId] = maxFollowing
 
-    def score(self, sentence):
-        """ Takes a list of strings as argument and returns the log-probability of the
-            sentence using your language model. Use whatever data you computed in train() here.
+    def buildBounds(self):
+        """ Precomputes, per word id, the highest log-probability of any token following it
+            (maxFollowing) and of it following any token (maxPreceding), for localScoreBound.
         """
-        score = 0.0
-        prev = " "
-        for token in sentence:
-            # print(token)
-            # length = len(self.bigramCounts)
-            bigram = "%s %s" % (prev, token)
-            # bigram = prev + " " + token
-            if bigram in self.bigramCounts:
-                # print("a")
-                score += math.log(self.bigramCounts[bigram])
-                if prev in self.unigramCounts:
-                    score -= math.log(self.unigramCounts[prev])
-                else:
-                    score -= math.log(self.unigramCounts["UNK"])
-            else:
-                # discount = 0.3
-                discount = 0.4
-                # print("b")
-                if token in self.unigramCounts:
-                    score += math.log(self.unigramCounts[token])
-                else:
-                    score += math.log(self.unigramCounts["UNK"])
-                score += math.log(discount) - \
-                    math.log(self.total + len(self.unigramCounts))
-            prev = token
-            # if length != len(self.bigramCounts):
-            #     print("Alert!")
-        # print("Size is " + str(len(self.unigramCounts)))
-        return score
+        # an unseen bigram scores the backoffLogProbs entry of its token plus the
+        # contextWeights entry of its context
+        maxBackoff = max(max(self.backoffLogProbs), self.unknownLogProb)
+        maxWeight = max(max(self.contextWeights), 0.0)
+        self.maxFollowing = array.array('d', [maxBackoff + weight
+                                              for weight in self.contextWeights])
+        self.maxPreceding = array.array('d', [logProb + maxWeight
+                                              for logProb in self.backoffLogProbs])
+        self.unknownFollowing = maxBackoff
+        self.unknownPreceding = self.unknownLogProb + maxWeight
+        counts = self.counts
+        for key, logProb in self.bigramLogProbs.iteritems():
+            prevId, tokenId = counts.splitBigramKey(key)
+            if logProb > self.maxFollowing[prevId]:
+                self.maxFollowing[prevId] = logProb
+            if logProb > self.maxPreceding[tokenId]:
+                self.maxPreceding[tokenId] = logProb
+
+    def buildBatchTables(self, sortedKeys, sortedLogProbs):
+        """Sets up the numpy tables tokenScoresBatch reads, from the bigram table as
+           sorted key and value arrays."""
+        self.sortedKeys, self.sortedLogProbs = sortedKeys, sortedLogProbs
+        self.backoffLogProbArray = withUnknown(self.backoffLogProbs, self.unknownLogProb)
+        self.contextWeightArray = withUnknown(self.contextWeights, 0.0)
+
+    def snapshot(self):
+        """BigramModel.snapshot, with the unigram log-probabilities and context weights."""
+        meta, sections = BigramModel.snapshot(self)
+        meta['unknownLogProb'] = self.unknownLogProb
+        sections['backoffLogProbs'] = self.backoffLogProbs
+        sections['contextWeights'] = self.contextWeights
+        return meta, sections
+
+    def restore(self, meta, sections):
+        """BigramModel.restore, with the unigram log-probabilities and context weights."""
+        self.unknownLogProb = meta['unknownLogProb']
+        self.backoffLogProbs = sections['backoffLogProbs']
+        self.contextWeights = sections['contextWeights']
+        BigramModel.restore(self, meta, sections)
+
+    def tokenScore(self, prev, token):
+        """Returns the log-probability term for token following prev."""
+        counts = self.counts
+        prevId = counts.wordId(prev)
+        tokenId = counts.wordId(token)
+        key = counts.bigramKey(prevId, tokenId)
+        logProb = self.bigramLogProbs.get(key)
+        if logProb is not None:
+            return logProb
+        weight = 0.0
+        if prevId >= 0:
+            weight = self.contextWeights[prevId]
+        if tokenId < 0:
+            return self.unknownLogProb + weight
+        return self.backoffLogProbs[tokenId] + weight
+
+    def tokenScoresBatch(self, prevIds, tokenIds):
+        """Vectorized tokenScore over numpy arrays of word ids."""
+        if self.sortedKeys is None:
+            self.buildBatchTables(*sortedTable(self.bigramLogProbs))
+        found, logProbs = lookupTable(self.sortedKeys, self.sortedLogProbs, prevIds, tokenIds)
+        return np.where(found, logProbs,
+                        self.backoffLogProbArray[tokenIds] + self.contextWeightArray[prevIds])
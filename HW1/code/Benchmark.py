@@ -0,0 +1,176 @@
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from Corpus import Corpus
+from EditModel import EditModel
+from NgramStore import NgramStore, CompactTable
+from SpellCorrect import SpellCorrect
+from UniformModel import UniformModel
+from UnigramModel import UnigramModel
+from SmoothUnigramModel import SmoothUnigramModel
+from SmoothBigramModel import SmoothBigramModel
+from BackoffModel import BackoffModel
+from CustomModel import CustomModel
+
+# Benchmarks the spelling pipeline and prints the results as JSON, so runs of different
+# versions can be compared. Every language model is benchmarked in a forked process of its
+# own, which gives it its own peak memory figure and a cold edit probability cache.
+# Accuracies are reported with the timings so a speedup cannot silently change results.
+
+MODELS = [UnigramModel, UniformModel, SmoothUnigramModel, SmoothBigramModel, BackoffModel,
+          CustomModel]
+CACHE_SIZE = 10000  # as in SpellCorrect.main
+# the models compact() applies to, and the (cutoff, bits) settings tried on each
+COMPACT_MODELS = [SmoothBigramModel, BackoffModel, CustomModel]
+COMPACT_SETTINGS = [(cutoff, bits) for cutoff in (0, 1, 2) for bits in (0, 16, 8)]
+
+
+def timed(function, *args):
+    """Returns (function(*args), seconds taken)."""
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+
+def peakMemoryKb():
+    """Peak resident set size of this process so far, in kilobytes (Linux reports KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def benchmarkEditModel(trainingCorpus, devCorpus):
+    """Times building an uncached EditModel and editProbabilities on every distinct error
+       word of the dev corpus."""
+    editModel, buildSeconds = timed(EditModel, 'data/count_1edit.txt', trainingCorpus)
+    words = sorted(set(datum.error for sentence in devCorpus.corpus
+                       for datum in sentence.data if datum.hasError()))
+    start = time.time()
+    candidates = 0
+    for word in words:
+        candidates += len(editModel.editProbabilities(word))
+    seconds = time.time() - start
+    return {
+        'buildSeconds': buildSeconds,
+        'words': len(words),
+        'candidates': candidates,
+        'msPerWord': 1000 * seconds / max(len(words), 1),
+    }
+
+
+def benchmarkModel(cls, trainingCorpus, devCorpus, counts, editModel):
+    """Times training cls alone and from shared counts, and evaluating it on devCorpus."""
+    baseMemoryKb = peakMemoryKb()
+    trainSeconds = timed(cls, trainingCorpus)[1]
+    lm, sharedTrainSeconds = timed(cls, trainingCorpus, counts)
+    speller = SpellCorrect(lm, trainingCorpus, editModel=editModel)
+    outcome, evaluateSeconds = timed(speller.evaluate, devCorpus)
+    return {
+        'trainSeconds': trainSeconds,
+        'trainFromCountsSeconds': sharedTrainSeconds,
+        'evaluateSeconds': evaluateSeconds,
+        'sentencesPerSecond': outcome.numTotal / max(evaluateSeconds, 1e-9),
+        'correct': outcome.numCorrect,
+        'total': outcome.numTotal,
+        'accuracy': outcome.getAccuracy(),
+        'baseMemoryKb': baseMemoryKb,
+        'peakMemoryKb': peakMemoryKb(),
+    }
+
+
+def tableBytes(table):
+    """Bytes taken by a bigram table: a CompactTable's arrays, or a dict with its keys and
+       values."""
+    if isinstance(table, CompactTable):
+        return table.memoryBytes()
+    return sys.getsizeof(table) + sum(sys.getsizeof(key) + sys.getsizeof(value)
+                                      for key, value in table.iteritems())
+
+
+def countBytes(counts):
+    """Bytes taken by the counts of an NgramStore: its bigram count table and per-word count
+       arrays. The vocabulary, which compaction does not change, is left out."""
+    return tableBytes(counts.bigramCounts) + sum(
+        perWord.itemsize * len(perWord)
+        for perWord in (counts.unigramCounts, counts.followerTypeCounts,
+                        counts.continuationTypeCounts))
+
+
+def benchmarkCompaction(cls, trainingCorpus, devCorpus, counts, editModel):
+    """Measures the bigram table and count sizes and dev accuracy of cls under every
+       COMPACT_SETTINGS. totalBytes is the two together, what the model keeps in memory
+       besides its vocabulary and per-word tables."""
+    lm = cls(trainingCorpus, counts)
+    results = []
+    for cutoff, bits in COMPACT_SETTINGS:
+        lm.compact(cutoff, bits)
+        outcome = SpellCorrect(lm, trainingCorpus, editModel=editModel).evaluate(devCorpus)
+        results.append({
+            'cutoff': cutoff,
+            'bits': bits,
+            'bigrams': len(lm.bigramLogProbs),
+            'tableBytes': tableBytes(lm.bigramLogProbs),
+            'countBytes': countBytes(lm.counts),
+            'totalBytes': tableBytes(lm.bigramLogProbs) + countBytes(lm.counts),
+            'correct': outcome.numCorrect,
+            'accuracy': outcome.getAccuracy(),
+        })
+    return results
+
+
+def runInChild(connection, function, args):
+    connection.send(function(*args))
+    connection.close()
+
+
+def inChild(function, *args):
+    """Returns function(*args), run in a forked process that shares the parent's data."""
+    receiver, sender = multiprocessing.Pipe(False)
+    child = multiprocessing.Process(target=runInChild, args=(sender, function, args))
+    child.start()
+    result = receiver.recv()
+    child.join()
+    return result
+
+
+def main():
+    """Runs the benchmark and writes its JSON results to stdout, or to the file named by the
+       first argument."""
+    trainPath = 'data/tagged-train.dat'
+    devPath = 'data/tagged-dev.dat'
+    trainingCorpus, trainLoadSeconds = timed(Corpus, trainPath)
+    devCorpus, devLoadSeconds = timed(Corpus, devPath)
+    counts, countSeconds = timed(NgramStore, trainingCorpus)
+    editModel = EditModel('data/count_1edit.txt', trainingCorpus, CACHE_SIZE)
+
+    results = {
+        'python': platform.python_version(),
+        'corpusLoad': {
+            'trainSeconds': trainLoadSeconds,
+            'trainSentences': len(trainingCorpus.corpus),
+            'devSeconds': devLoadSeconds,
+            'devSentences': len(devCorpus.corpus),
+        },
+        'countSeconds': countSeconds,
+        'editModel': inChild(benchmarkEditModel, trainingCorpus, devCorpus),
+        'models': {},
+        'compaction': {},
+    }
+    for cls in MODELS:
+        results['models'][cls.__name__] = inChild(
+            benchmarkModel, cls, trainingCorpus, devCorpus, counts, editModel)
+    for cls in COMPACT_MODELS:
+        results['compaction'][cls.__name__] = inChild(
+            benchmarkCompaction, cls, trainingCorpus, devCorpus, counts, editModel)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w') as f:
+            f.write(output + '\n')
+    else:
+        print output
+
+
+if __name__ == "__main__":
+    main()
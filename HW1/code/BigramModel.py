@@ -0,0 +1,171 @@
+from NgramStore import NgramStore, CompactTable, np, sortedTable
+import Snapshot
+
+
+class BigramModel(object):
+    """Base of the bigram language models. The counts live in an NgramStore, which may be
+       shared with other models. A subclass precomputes its log-probabilities from them in
+       finalize(), into bigramLogProbs for the seen bigrams and tables of its own for the
+       unseen ones, and scores one bigram with tokenScore and tokenScoresBatch; the sentence
+       scores, bounds and batches here are built on those."""
+
+    def __init__(self, corpus, counts=None):
+        """Trains on corpus, or takes counts, an NgramStore already trained on corpus and
+           shared with other models, in which case corpus is not read again."""
+        # see compact()
+        self.cutoff = 0
+        self.bits = 0
+        if counts is None:
+            self.counts = NgramStore()
+            self.train(corpus)
+        else:
+            self.counts = counts
+        self.finalize()
+
+    def train(self, corpus):
+        """ Takes a corpus and trains your language model.
+            Compute any counts or other corpus statistics in this function.
+        """
+        self.counts.train(corpus)
+
+    def compact(self, cutoff=1, bits=0):
+        """ Saves memory by pruning the bigrams seen at most cutoff times, which then score
+            as unseen, and with bits 8 or 16 by quantizing the kept log-probabilities to
+            that many bits. The counts, which may be shared, keep every bigram but are
+            frozen into arrays (see NgramStore.freeze). compact(0, 0) goes back to the full
+            model and count dict.
+        """
+        self.cutoff = cutoff
+        self.bits = bits
+        if cutoff or bits:
+            self.counts.freeze()
+        else:
+            self.counts.thaw()
+        self.finalize()
+
+    def compactTable(self):
+        """ Stores a pruned or quantized bigram table as a CompactTable, then builds the
+            bounds and, for a full table, the batch tables. The last step of finalize().
+        """
+        if self.cutoff or self.bits:
+            self.bigramLogProbs = CompactTable(self.bigramLogProbs, self.bits)
+            # built on the first batch call
+            self.sortedKeys = None
+        self.buildBounds()
+        if np is not None and not (self.cutoff or self.bits):
+            self.buildBatchTables(*sortedTable(self.bigramLogProbs))
+
+    def update(self, sentences):
+        """ Adds sentences (lists of words) to the counts and refreshes the affected
+            log-probabilities instead of retraining (see the subclass's refreshContexts for
+            what that costs). When the counts are shared with other models, call
+            counts.update once and pass its result to refresh on each of them.
+        """
+        self.refresh(self.counts.update(sentences))
+
+    def refresh(self, contexts):
+        """ Recomputes the log-probabilities in the given contexts (word ids) after the
+            counts changed, with the subclass's refreshContexts. Bounds only get looser;
+            finalize() makes them tight again. A compacted or restored model, whose bigram
+            table is a CompactTable, is finalized again instead.
+        """
+        if isinstance(self.bigramLogProbs, CompactTable):
+            self.finalize()
+            return
+        self.refreshContexts(contexts)
+        # rebuilt on the next batch call
+        self.sortedKeys = None
+
+    def snapshot(self):
+        """Returns the (meta, sections) a Snapshot file stores for the counts, bigram table
+           and bounds; subclasses add their own tables."""
+        meta = {'cutoff': self.cutoff, 'bits': self.bits}
+        sections = {}
+        Snapshot.storeSections(self.counts, meta, sections)
+        Snapshot.tableSections(self.bigramLogProbs, sections, 'bigramLogProbs')
+        Snapshot.boundSections(self, meta, sections)
+        return meta, sections
+
+    def restore(self, meta, sections):
+        """Fills a model created without __init__ from a snapshot, instead of training, once
+           the subclass has restored its own tables. The arrays and bigram table stay the
+           snapshot's own, so update() finalizes again."""
+        self.counts = Snapshot.restoreStore(meta, sections)
+        self.cutoff = meta['cutoff']
+        self.bits = meta['bits']
+        self.bigramLogProbs = Snapshot.restoreTable(sections, 'bigramLogProbs')
+        Snapshot.restoreBounds(self, meta, sections)
+        if np is not None:
+            self.buildBatchTables(*sortedTable(self.bigramLogProbs))
+
+    def score(self, sentence):
+        """ Takes a list of strings as argument and returns the log-probability of the
+            sentence using your language model. Use whatever data you computed in train() here.
+        """
+        score = 0.0
+        prev = " "
+        for token in sentence:
+            score += self.tokenScore(prev, token)
+            prev = token
+        return score
+
+    def localScore(self, sentence, i, word):
+        """Returns the part of score(sentence) that depends on position i,
+           with word at position i: the bigrams ending and starting there."""
+        prev = " "
+        if i > 0:
+            prev = sentence[i - 1]
+        score = self.tokenScore(prev, word)
+        if i + 1 < len(sentence):
+            score += self.tokenScore(word, sentence[i + 1])
+        return score
+
+    def localScoreBound(self, sentence, i):
+        """Returns an upper bound on localScore(sentence, i, word) over every word, from the
+           maxFollowing / maxPreceding tables of the subclass's buildBounds()."""
+        counts = self.counts
+        prev = " "
+        if i > 0:
+            prev = sentence[i - 1]
+        prevId = counts.wordId(prev)
+        bound = self.unknownFollowing
+        if prevId >= 0:
+            bound = self.maxFollowing[prevId]
+        if i + 1 < len(sentence):
+            nextId = counts.wordId(sentence[i + 1])
+            if nextId >= 0:
+                bound += self.maxPreceding[nextId]
+            else:
+                bound += self.unknownPreceding
+        return bound
+
+    def scoreDelta(self, sentence, i, word):
+        """Returns the change in score(sentence) when the token at position i becomes word."""
+        return self.localScore(sentence, i, word) - \
+            self.localScore(sentence, i, sentence[i])
+
+    def scoreBatch(self, sentences):
+        """Returns the scores of a list of sentences, computed in one vectorized pass when
+           numpy is available."""
+        if np is None:
+            return [self.score(sentence) for sentence in sentences]
+        counts = self.counts
+        prevIds, tokenIds, owners = counts.vocabulary.batchIds(sentences, counts.startId)
+        return np.bincount(owners, self.tokenScoresBatch(prevIds, tokenIds), len(sentences))
+
+    def localScoreBatch(self, sentence, positions, words):
+        """Returns localScore(sentence, positions[k], words[k]) for every k, computed in one
+           vectorized pass when numpy is available."""
+        if np is None:
+            return [self.localScore(sentence, i, word) for i, word in zip(positions, words)]
+        counts = self.counts
+        vocabulary = counts.vocabulary
+        wordIds = vocabulary.idArray(words)
+        positions = np.asarray(positions, np.int64)
+        # sentenceIds[i + 1] is the id at position i, and sentenceIds[0] the start symbol
+        sentenceIds = np.concatenate(([counts.startId], vocabulary.idArray(sentence)))
+        scores = self.tokenScoresBatch(sentenceIds[positions], wordIds)
+        hasNext = positions + 1 < len(sentence)
+        scores[hasNext] += self.tokenScoresBatch(wordIds[hasNext],
+                                                 sentenceIds[positions[hasNext] + 2])
+        return scores
@@ -0,0 +1,142 @@
+import array
+import bisect
+from Corpus import Corpus
+from Datum import Datum
+from Sentence import Sentence
+from NgramStore import Vocabulary
+
+
+class ColumnarCorpus(Corpus):
+    """A corpus stored as columns instead of Sentence and Datum objects.
+
+       wordIds holds the id of every correct word as an int32 array, sentence k spans
+       wordIds[offsets[k]:offsets[k+1]], and errorPositions / errorIds are a sparse table,
+       sorted by position, of the tokens that have an error word. Iterating corpus yields
+       ColumnarSentence views over these arrays."""
+
+    def __init__(self, corpus=None):
+        """Copies the sentences of corpus, which may be a StreamingCorpus."""
+        self.words = Vocabulary()
+        self.wordIds = array.array('i')
+        self.offsets = array.array('l', [0])
+        self.errorPositions = array.array('l')
+        self.errorIds = array.array('i')
+        if corpus is not None:
+            for sentence in corpus.corpus:
+                self.append(sentence)
+
+    def append(self, sentence):
+        """Adds a sentence to the end of the corpus."""
+        for datum in sentence.data:
+            if datum.hasError():
+                self.errorPositions.append(len(self.wordIds))
+                self.errorIds.append(self.words.intern(datum.error))
+            self.wordIds.append(self.words.intern(datum.word))
+        self.offsets.append(len(self.wordIds))
+
+    @property
+    def corpus(self):
+        return (ColumnarSentence(self, k) for k in xrange(len(self)))
+
+    def getSentence(self, k):
+        return ColumnarSentence(self, k)
+
+    def getWord(self, position):
+        return self.words.getWord(self.wordIds[position])
+
+    def getError(self, position):
+        """Returns the error word at a position, or '' if it has none."""
+        k = bisect.bisect_left(self.errorPositions, position)
+        if k < len(self.errorPositions) and self.errorPositions[k] == position:
+            return self.words.getWord(self.errorIds[k])
+        return ''
+
+    def errorRange(self, start, end):
+        """Returns the range of indices into the error table for positions in [start, end)."""
+        return bisect.bisect_left(self.errorPositions, start), \
+            bisect.bisect_left(self.errorPositions, end)
+
+    def vocabulary(self):
+        """Returns a set of all the words in the corpus"""
+        ret = set()
+        for k in xrange(len(self)):
+            ret.update(self.wordIds[self.offsets[k] + 1:self.offsets[k + 1] - 1])
+        return set(self.words.getWord(wordId) for wordId in ret)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+class ColumnarDatum(Datum):
+    """A read-only Datum reading its word and error from a ColumnarCorpus position."""
+    __slots__ = ('columns', 'position')
+
+    def __init__(self, columns, position):
+        self.columns = columns
+        self.position = position
+
+    @property
+    def word(self):
+        return self.columns.getWord(self.position)
+
+    @property
+    def error(self):
+        return self.columns.getError(self.position)
+
+
+class ColumnarSentence(Sentence):
+    """A read-only Sentence over sentence k of a ColumnarCorpus. data builds ColumnarDatums
+       on demand; the other methods read the columns directly."""
+    __slots__ = ('columns', 'start', 'end')
+
+    def __init__(self, columns, k):
+        self.columns = columns
+        self.start = columns.offsets[k]
+        self.end = columns.offsets[k + 1]
+
+    @property
+    def data(self):
+        return [ColumnarDatum(self.columns, position) for position in xrange(self.start, self.end)]
+
+    def getCorrectSentence(self):
+        """Returns a list of strings with the sentence containing all corrections."""
+        words = self.columns.words.words
+        return [words[wordId] for wordId in self.columns.wordIds[self.start:self.end]]
+
+    def getErrorSentence(self):
+        """Returns a list of strings with the sentence containing all errors."""
+        errorSentence = self.getCorrectSentence()
+        columns = self.columns
+        first, last = columns.errorRange(self.start, self.end)
+        for k in xrange(first, last):
+            errorSentence[columns.errorPositions[k] - self.start] = \
+                columns.words.getWord(columns.errorIds[k])
+        return errorSentence
+
+    def isCorrection(self, candidate):
+        """Checks if a list of strings is a correction of this sentence."""
+        return list(candidate) == self.getCorrectSentence()
+
+    def getErrorIndex(self):
+        first, last = self.columns.errorRange(self.start, self.end)
+        if first == last:
+            return -1
+        return self.columns.errorPositions[first] - self.start
+
+    def len(self):
+        return self.end - self.start
+
+    def get(self, i):
+        return ColumnarDatum(self.columns, self.start + i)
+
+    def put(self, i, val):
+        raise TypeError('ColumnarSentence is read-only; copy it with Sentence(sentence)')
+
+    def append(self, item):
+        raise TypeError('ColumnarSentence is read-only; copy it with Sentence(sentence)')
+
+    def isEmpty(self):
+        return self.end == self.start
+
+    def __len__(self):
+        return self.end - self.start
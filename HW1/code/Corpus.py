@@ -1,5 +1,27 @@
+import mmap
+import os
+import string
 from Datum import Datum
-from Sentence import Sentence
+from Sentence import Sentence, SentenceView
+
+# processLine lower-cases a line and drops these characters in a single str.translate pass
+LOWERCASE = string.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+IGNORED_CHARACTERS = '",.!\':;'
+UNICODE_IGNORED_CHARACTERS = dict((ord(c), None) for c in IGNORED_CHARACTERS)
+
+
+def readLines(filename):
+    """Yields the lines of a file through a read-only memory map, so pages are read as
+       they are reached instead of loading the whole file up front."""
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for line in iter(contents.readline, ''):
+                yield line
+        finally:
+            contents.close()
 
 
 class Corpus:
@@ -13,14 +35,10 @@ class Corpus:
 
     def processLine(self, line):
         line = line.strip()
-        line = line.lower()
-        line = line.replace('"', '')
-        line = line.replace(',', '')
-        line = line.replace('.', '')
-        line = line.replace('!', '')
-        line = line.replace("'", '')
-        line = line.replace(":", '')
-        line = line.replace(";", '')
+        if isinstance(line, unicode):
+            line = line.lower().translate(UNICODE_IGNORED_CHARACTERS)
+        else:
+            line = line.translate(LOWERCASE, IGNORED_CHARACTERS)
         if line == '':
             return None
         processed_tokens = Sentence()
@@ -52,12 +70,14 @@ class Corpus:
     def readCorpus(self, filename):
         """Read in data, returns a list (sentence) of list(words) of lists(alternatives).
            The first item in each word list is the correct word."""
-        f = open(filename)
-        self.corpus = []
-        for line in f:
+        self.corpus = list(self.iterSentences(filename))
+
+    def iterSentences(self, filename):
+        """Yields the sentences of a file one at a time."""
+        for line in readLines(filename):
             sentence = self.processLine(line)
             if sentence:
-                self.corpus.append(sentence)
+                yield sentence
 
     def generateTestCases(self):
         """Returns a list of sentences with exactly 1 eligible spelling error"""
@@ -72,6 +92,15 @@ class Corpus:
                     testCases.append(testSentence)
         return testCases
 
+    def iterTestCases(self):
+        """Yields the same test cases as generateTestCases, one at a time, as SentenceViews
+           over the corpus sentences instead of copies."""
+        for sentence in self.corpus:
+            for i in range(0, len(sentence)):
+                datum_i = sentence.get(i)
+                if datum_i.hasError() and datum_i.isValidTest():
+                    yield SentenceView(sentence, i)
+
     def slurpString(self, contents):
         """Reads a clean corpus from string instead of file. Used for submission."""
         lines = contents.split('\n')
@@ -93,3 +122,16 @@ class Corpus:
         for sentence in self.corpus:
             str_list.append(str(sentence))
         return '\n'.join(str_list)
+
+
+class StreamingCorpus(Corpus):
+    """A corpus that is read from its file again every time its sentences are iterated,
+       for training text too large to keep in memory. corpus is an iterable instead of a
+       list, so it supports everything that only loops over it once."""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    @property
+    def corpus(self):
+        return self.iterSentences(self.filename)
@@ -1,85 +1,197 @@
 import math
-import collections
+import array
+from NgramStore import np, sortedTable, lookupTable, withUnknown, pruneTable
+from BigramModel import BigramModel
 
 
 # Kneser-Ney Smoothing model
-class CustomModel:
-
-    def __init__(self, corpus):
-        """Initial custom language model and structures needed by this mode"""
-        self.unigramCounts = collections.defaultdict(lambda: 0)
-        self.bigramCounts = collections.defaultdict(lambda: 0)
-        self.asFirstTypeCounts = collections.defaultdict(lambda: 0)
-        self.asSecondTypeCounts = collections.defaultdict(lambda: 0)
+class CustomModel(BigramModel):
+
+    def __init__(self, corpus, counts=None):
+        """Initial custom language model and structures needed by this mode."""
         self.d = 0.75
-        self.total = 0
-        self.train(corpus)
+        BigramModel.__init__(self, corpus, counts)
+
+    def contextTerms(self, prevId, countBigram):
+        """ Returns the discounted bigram probability and the interpolation weight lam
+            for a bigram seen countBigram times after prevId.
+        """
+        counts = self.counts
+        d = self.d
+        if countBigram == 0:
+            d = -0.000027
+        elif countBigram == 1:
+            d = -0.448
+
+        # unseen contexts count once
+        countPrev = counts.unigramCount(prevId)
+        if countPrev == 0:
+            countPrev = 1
+
+        firstTerm = max(countBigram - d, 0)
+        firstTerm = float(firstTerm) / countPrev
 
-    def train(self, corpus):
-        """ Takes a corpus and trains your language model.
+        lam = self.d * counts.followerTypeCount(prevId) / countPrev
+        return firstTerm, lam
+
+    def finalize(self):
+        """ Precomputes log-probabilities of the seen bigrams, and the discounted term,
+            interpolation weight and continuation probability used for unseen ones.
+            Must be called again after train().
         """
-        for sentence in corpus.corpus:
-            prev = " "
-            for datum in sentence.data:
-                self.total += 1
-                token = datum.word
-                self.unigramCounts[token] += 1
-                bigram = "%s %s" % (prev, token)
-                self.bigramCounts[bigram] += 1
-                prev = token
-
-        # count for continuation
-        for w in self.unigramCounts:
-            # calculate w as first word
-            for bigram in self.bigramCounts:
-                if bigram.startswith(w):
-                    self.asFirstTypeCounts[w] += 1
-                if bigram.endswith(w):
-                    self.asSecondTypeCounts[w] += 1
-            # calculate w as second word
-
-        self.bigramCounts["UNK"] = 0
-        self.unigramCounts["UNK"] = 1
-        self.asFirstTypeCounts["UNK"] = 0
-        self.asSecondTypeCounts["UNK"] = 0
-
-    def score(self, sentence):
-        """ With list of strings, return the log-probability of the sentence with language model. Use
-            information generated from train.
+        counts = self.counts
+        # one extra bigram type stands for all unseen bigrams
+        bigramTypes = counts.bigramTypes() + 1
+        self.finalizedTypes = bigramTypes
+        self.continuationProbs = array.array('d')
+        for asSecond in counts.continuationTypeCounts:
+            self.continuationProbs.append(float(asSecond) / bigramTypes)
+        self.unseenFirstTerms = array.array('d')
+        self.backoffWeights = array.array('d')
+        for prevId in xrange(len(counts.unigramCounts)):
+            firstTerm, lam = self.contextTerms(prevId, 0)
+            self.unseenFirstTerms.append(firstTerm)
+            self.backoffWeights.append(lam)
+        self.unknownContextTerms = self.contextTerms(-1, 0)
+        self.bigramLogProbs = {}
+        for key, count in counts.bigramCounts.iteritems():
+            prevId, tokenId = counts.splitBigramKey(key)
+            firstTerm, lam = self.contextTerms(prevId, count)
+            self.bigramLogProbs[key] = \
+                math.log(firstTerm + lam * self.continuationProbs[tokenId])
+        if self.cutoff:
+            self.pruneBigrams()
+        self.compactTable()
+
+    def pruneBigrams(self):
+        """ Prunes the bigram table to self.cutoff, moving the probability of the pruned
+            bigrams of each context to its unseen bigrams by scaling both terms of that
+            context's unseen probability.
         """
-        score = 0.0
-        prev = " "
-        for token in sentence:
-            firstTerm = 0.0
-            d = self.d
-            bigram = "%s %s" % (prev, token)
-            countBigram = self.bigramCounts["UNK"]
-            countPrev = self.unigramCounts["UNK"]
-            asFirst = self.asFirstTypeCounts["UNK"]
-            asSecond = self.asSecondTypeCounts["UNK"]
-            if bigram in self.bigramCounts:
-                countBigram = self.bigramCounts[bigram]
-
-            if countBigram == 0:
-                d = -0.000027
-            elif countBigram == 1:
-                d = -0.448
-
-            if prev in self.unigramCounts:
-                countPrev = self.unigramCounts[prev]
-
-            if prev in self.asFirstTypeCounts:
-                asFirst = self.asFirstTypeCounts[prev]
-
-            if token in self.asSecondTypeCounts:
-                asSecond = self.asSecondTypeCounts[token]
-
-            firstTerm = max(countBigram - d, 0)
-            firstTerm = float(firstTerm) / countPrev
-
-            lam = self.d * asFirst / countPrev
-
-            continuation = float(asSecond) / len(self.bigramCounts)
-            score += math.log(firstTerm + lam * continuation)
-            prev = token
-        return score
+        counts = self.counts
+        vocabularySize = len(counts.unigramCounts)
+        continuationMass = sum(self.continuationProbs)
+
+        def unseenMasses(prevId, seenIds, prunedIds):
+            firstTerm = self.unseenFirstTerms[prevId]
+            lam = self.backoffWeights[prevId]
+            seenContinuation = sum(self.continuationProbs[tokenId] for tokenId in seenIds)
+            prunedContinuation = sum(self.continuationProbs[tokenId] for tokenId in prunedIds)
+            return (vocabularySize - len(seenIds)) * firstTerm + \
+                lam * (continuationMass - seenContinuation), \
+                len(prunedIds) * firstTerm + lam * prunedContinuation
+
+        self.bigramLogProbs, weights = pruneTable(counts, self.bigramLogProbs, self.cutoff,
+                                                  unseenMasses)
+        for prevId, weight in weights.iteritems():
+            scale = math.exp(weight)
+            self.unseenFirstTerms[prevId] *= scale
+            self.backoffWeights[prevId] *= scale
+
+    def refreshContexts(self, contexts):
+        """ Recomputes the given contexts when the text added no bigram types. A new
+            bigram type changes every continuation probability, which sits inside every
+            stored log-probability, so then this is finalize() over the updated counts: no
+            corpus is reread, but nothing is saved over retraining from the counts either.
+        """
+        counts = self.counts
+        if counts.bigramTypes() + 1 != self.finalizedTypes:
+            self.finalize()
+            return
+        maxContinuation = max(self.continuationProbs)
+        for prevId in contexts:
+            firstTerm, lam = self.contextTerms(prevId, 0)
+            self.unseenFirstTerms[prevId] = firstTerm
+            self.backoffWeights[prevId] = lam
+            maxFollowing = math.log(firstTerm + lam * maxContinuation)
+            for tokenId in counts.followers[prevId]:
+                key = counts.bigramKey(prevId, tokenId)
+                firstTerm, lam = self.contextTerms(prevId, counts.bigramCounts[key])
+                logProb = math.log(firstTerm + lam * self.continuationProbs[tokenId])
+                self.bigramLogProbs[key] = logProb
+                maxFollowing = max(maxFollowing, logProb)
+                if logProb > self.maxPreceding[tokenId]:
+                    self.maxPreceding[tokenId] = logProb
+            self.maxFollowing[prevId] = maxFollowing
+
+    def buildBounds(self):
+        """ Precomputes, per word id, the highest log-probability of any token following it
+            (maxFollowing) and of it following any token (maxPreceding), for localScoreBound.
+        """
+        # an unseen bigram scores log(firstTerm + lam * continuation), with the first two
+        # taken from its context and the last from its token
+        maxContinuation = max(self.continuationProbs)
+        maxFirstTerm = max(max(self.unseenFirstTerms), self.unknownContextTerms[0])
+        maxLam = max(max(self.backoffWeights), self.unknownContextTerms[1])
+        self.maxFollowing = array.array('d', [
+            math.log(firstTerm + lam * maxContinuation)
+            for firstTerm, lam in zip(self.unseenFirstTerms, self.backoffWeights)])
+        self.maxPreceding = array.array('d', [
+            math.log(maxFirstTerm + maxLam * continuation)
+            for continuation in self.continuationProbs])
+        firstTerm, lam = self.unknownContextTerms
+        self.unknownFollowing = math.log(firstTerm + lam * maxContinuation)
+        self.unknownPreceding = math.log(maxFirstTerm)
+        counts = self.counts
+        for key, logProb in self.bigramLogProbs.iteritems():
+            prevId, tokenId = counts.splitBigramKey(key)
+            if logProb > self.maxFollowing[prevId]:
+                self.maxFollowing[prevId] = logProb
+            if logProb > self.maxPreceding[tokenId]:
+                self.maxPreceding[tokenId] = logProb
+
+    def buildBatchTables(self, sortedKeys, sortedLogProbs):
+        """Sets up the numpy tables tokenScoresBatch reads, from the bigram table as
+           sorted key and value arrays."""
+        self.sortedKeys, self.sortedLogProbs = sortedKeys, sortedLogProbs
+        self.unseenFirstTermArray = withUnknown(self.unseenFirstTerms, self.unknownContextTerms[0])
+        self.backoffWeightArray = withUnknown(self.backoffWeights, self.unknownContextTerms[1])
+        self.continuationProbArray = withUnknown(self.continuationProbs, 0.0)
+
+    def snapshot(self):
+        """BigramModel.snapshot, with the discount, unseen terms and continuation probabilities."""
+        meta, sections = BigramModel.snapshot(self)
+        meta['d'] = self.d
+        meta['unknownContextTerms'] = list(self.unknownContextTerms)
+        sections['continuationProbs'] = self.continuationProbs
+        sections['unseenFirstTerms'] = self.unseenFirstTerms
+        sections['backoffWeights'] = self.backoffWeights
+        return meta, sections
+
+    def restore(self, meta, sections):
+        """BigramModel.restore, with the discount, unseen terms and continuation probabilities."""
+        self.d = meta['d']
+        self.unknownContextTerms = tuple(meta['unknownContextTerms'])
+        self.continuationProbs = sections['continuationProbs']
+        self.unseenFirstTerms = sections['unseenFirstTerms']
+        self.backoffWeights = sections['backoffWeights']
+        BigramModel.restore(self, meta, sections)
+
+    def tokenScore(self, prev, token):
+        """Returns the Kneser-Ney log-probability of token following prev."""
+        counts = self.counts
+        prevId = counts.wordId(prev)
+        tokenId = counts.wordId(token)
+        key = counts.bigramKey(prevId, tokenId)
+        logProb = self.bigramLogProbs.get(key)
+        if logProb is not None:
+            return logProb
+
+        if prevId < 0:
+            firstTerm, lam = self.unknownContextTerms
+        else:
+            firstTerm = self.unseenFirstTerms[prevId]
+            lam = self.backoffWeights[prevId]
+        continuation = 0.0
+        if tokenId >= 0:
+            continuation = self.continuationProbs[tokenId]
+        return math.log(firstTerm + lam * continuation)
+
+    def tokenScoresBatch(self, prevIds, tokenIds):
+        """Vectorized tokenScore over numpy arrays of word ids."""
+        if self.sortedKeys is None:
+            self.buildBatchTables(*sortedTable(self.bigramLogProbs))
+        found, logProbs = lookupTable(self.sortedKeys, self.sortedLogProbs, prevIds, tokenIds)
+        unseen = np.log(self.unseenFirstTermArray[prevIds] +
+                        self.backoffWeightArray[prevIds] * self.continuationProbArray[tokenIds])
+        return np.where(found, logProbs, unseen)
@@ -1,8 +1,11 @@
 import re
 
-class Datum:
-    word = ''  # the correct word
-    error = ''  # the error word (if any)
+# matches any character that may not appear in a test word
+NON_LETTER = re.compile('[^a-zA-Z]')
+
+class Datum(object):
+    # word is the correct word, error the error word (if any)
+    __slots__ = ('word', 'error')
 
     def __init__(self):
         self.word = ''
@@ -25,11 +28,9 @@ class Datum:
         """Returns true if the error is within edit distance one and contains no numerics/punctuation."""
         if not self.hasError():
             return False
-        distance = levenshtein(self.word, self.error)
-        if (distance > 1):
+        if boundedLevenshtein(self.word, self.error, 1) > 1:
             return False
-        regex = '.*[^a-zA-Z].*'
-        if re.match(regex, self.word) or re.match(regex, self.error):
+        if NON_LETTER.search(self.word + self.error):
             return False
         return True
 
@@ -63,3 +64,96 @@ def levenshtein(seq1, seq2):
                 and seq1[x - 1] == seq2[y] and seq1[x] != seq2[y]):
                 thisrow[y] = min(thisrow[y], twoago[y - 2] + 1)
     return thisrow[len(seq2) - 1]
+
+
+def boundedLevenshtein(seq1, seq2, maxDistance):
+    """Calculate the Damerau-Levenshtein distance like levenshtein, but give up past
+    maxDistance: returns maxDistance + 1 for anything further apart. Only the diagonal
+    band of width maxDistance is filled in, and the loop stops at the first row whose
+    cells all exceed it.
+    """
+    len1, len2 = len(seq1), len(seq2)
+    limit = maxDistance + 1
+    if abs(len1 - len2) > maxDistance:
+        return limit
+    if maxDistance <= 1:
+        if seq1 == seq2:
+            return 0
+        return 1 if maxDistance == 1 and withinOneEdit(seq1, seq2) else limit
+
+    twoago = None
+    oneago = [min(y, limit) for y in xrange(len2 + 1)]
+    for x in xrange(1, len1 + 1):
+        thisrow = [limit] * (len2 + 1)
+        if x <= maxDistance:
+            thisrow[0] = x
+        rowMin = thisrow[0]
+        char1 = seq1[x - 1]
+        for y in xrange(max(1, x - maxDistance), min(len2, x + maxDistance) + 1):
+            char2 = seq2[y - 1]
+            cost = oneago[y - 1] + (char1 != char2)
+            if oneago[y] + 1 < cost:
+                cost = oneago[y] + 1
+            if thisrow[y - 1] + 1 < cost:
+                cost = thisrow[y - 1] + 1
+            # transpositions
+            if (x > 1 and y > 1 and char1 == seq2[y - 2]
+                and seq1[x - 2] == char2 and char1 != char2
+                and twoago[y - 2] + 1 < cost):
+                cost = twoago[y - 2] + 1
+            if cost > limit:
+                cost = limit
+            thisrow[y] = cost
+            if cost < rowMin:
+                rowMin = cost
+        if rowMin > maxDistance:
+            return limit
+        twoago, oneago = oneago, thisrow
+    return oneago[len2]
+
+
+def withinOneEdit(seq1, seq2):
+    """Returns true if seq1 becomes seq2 with at most one insertion, deletion,
+    substitution or transposition of adjacent characters, in linear time.
+    """
+    len1, len2 = len(seq1), len(seq2)
+    if abs(len1 - len2) > 1:
+        return False
+    # skip the common prefix, the one edit must be at its end
+    i = 0
+    shorter = min(len1, len2)
+    while i < shorter and seq1[i] == seq2[i]:
+        i += 1
+    if len1 > len2:
+        return seq1[i + 1:] == seq2[i:]
+    if len1 < len2:
+        return seq1[i:] == seq2[i + 1:]
+    if seq1[i + 1:] == seq2[i + 1:]:
+        return True
+    return (i + 1 < len1 and seq1[i] == seq2[i + 1] and seq1[i + 1] == seq2[i]
+            and seq1[i + 2:] == seq2[i + 2:])
+
+
+def boundedLevenshteinBatch(pairs, maxDistance):
+    """Returns the boundedLevenshtein distances of many (seq1, seq2) pairs, computing
+    each distinct pair once; annotated corpora repeat the same misspellings often.
+    """
+    distances = {}
+    ret = []
+    for pair in pairs:
+        distance = distances.get(pair)
+        if distance is None:
+            distance = boundedLevenshtein(pair[0], pair[1], maxDistance)
+            distances[pair] = distance
+        ret.append(distance)
+    return ret
+
+
+def validTests(data):
+    """Returns isValidTest for each of a list of Datums, with the distances of the
+    erroneous ones computed by one boundedLevenshteinBatch call.
+    """
+    pairs = [(datum.word, datum.error) for datum in data]
+    distances = iter(boundedLevenshteinBatch([pair for pair in pairs if pair[1]], 1))
+    return [bool(error) and next(distances) <= 1 and not NON_LETTER.search(word + error)
+            for word, error in pairs]
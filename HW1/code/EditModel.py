@@ -1,9 +1,14 @@
 import math
 import collections
+import time
 from Corpus import Corpus
+import Snapshot
+from VocabularyIndex import VocabularyIndex
 
 class Edit(object):
   """Holder object for edits (and the rules used to generate them)."""
+  __slots__ = ('editedWord', 'corruptLetters', 'correctLetters')
+
   def __init__(self, editedWord, corruptLetters, correctLetters):
     self.editedWord = editedWord
     # Represents x in the "P(x|w)" error probability term of the noisy channel model
@@ -23,19 +28,93 @@ class Edit(object):
   def __str__(self):
     return "Edit(editedWord=%s, rule=%s)" % (self.editedWord, self.rule())
 
+class Everything(object):
+  """A stand-in vocabulary that contains every word."""
+
+  def __contains__(self, word):
+    return True
+
 class EditModel(object):
   """An object representing the edit model for a spelling correction task."""
  
   ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
-  def __init__(self, editFile="data/count_1edit.txt", corpus=None):
+  def __init__(self, editFile="data/count_1edit.txt", corpus=None, cacheSize=0):
+    self.deleteIndex = None
+    # built on the first compoundEditProbabilities call
+    self.vocabularyIndex = None
+    # LRU cache of editProbabilities results, disabled when cacheSize is 0
+    self.cacheSize = cacheSize
+    self.clearCache()
+    # an Instrumentation, set by SpellCorrect(..., instrument=True)
+    self.instrumentation = None
     if corpus:
       self.vocabulary = corpus.vocabulary()
+      self.deleteIndex = self.buildDeleteIndex(self.vocabulary)
 
     self.editCounts = {}
     with open(editFile) as f:
       for line in f:
         rule, countString = line.split("\t")
         self.editCounts[rule] = int(countString)
+    self.buildRuleKeys()
+
+  def buildRuleKeys(self):
+    """Maps (corruptLetters, correctLetters) to the interned rule key of editCounts, so edits
+       can be matched against the counts without formatting a rule string each time."""
+    self.ruleKeys = {}
+    # corrupt letter -> the letters, in ALPHABET order, that a replace of it can produce
+    # with a nonzero count
+    replaceLetters = collections.defaultdict(str)
+    for rule in self.editCounts:
+      corruptLetters, correctLetters = rule.split("|")
+      self.ruleKeys[(corruptLetters, correctLetters)] = intern(rule)
+    for c in EditModel.ALPHABET:
+      for corruptLetters, correctLetters in self.ruleKeys:
+        if len(corruptLetters) == 1 and correctLetters == c:
+          replaceLetters[corruptLetters] += c
+    self.replaceLetters = dict(replaceLetters)
+
+  def clearCache(self):
+    """Empties the editProbabilities cache and resets its counters."""
+    self.cache = collections.OrderedDict()
+    self.cacheHits = 0
+    self.cacheMisses = 0
+    self.cacheEvictions = 0
+
+  def addWords(self, words):
+    """Adds words to the vocabulary after construction, e.g. from sentences passed to a
+       language model's update(), and empties the cache, whose candidate lists may change."""
+    for word in words:
+      if word not in self.vocabulary:
+        self.vocabulary.add(word)
+        for i in xrange(0, len(word)):
+          self.deleteIndex[word[:i] + word[i+1:]].append((word, i))
+        if self.vocabularyIndex is not None:
+          self.vocabularyIndex.add(word)
+    self.clearCache()
+
+  def snapshot(self):
+    """Returns the (meta, sections) a Snapshot file stores for this model. The delete index
+       and rule keys are rebuilt on load, the cache starts empty."""
+    sections = {}
+    Snapshot.wordTableSections(self.editCounts, sections, 'editCounts', 'l')
+    if self.deleteIndex is not None:
+      sections['vocabulary'] = sorted(self.vocabulary)
+    return {'cacheSize': self.cacheSize}, sections
+
+  def restore(self, meta, sections):
+    """Fills a model created without __init__ from a snapshot, instead of rereading the
+       edit counts and the corpus."""
+    self.cacheSize = meta['cacheSize']
+    self.clearCache()
+    self.instrumentation = None
+    self.editCounts = Snapshot.restoreWordTable(sections, 'editCounts', {})
+    self.buildRuleKeys()
+    self.deleteIndex = None
+    self.vocabularyIndex = None
+    if 'vocabulary' in sections:
+      self.vocabulary = set(sections['vocabulary'])
+      self.deleteIndex = self.buildDeleteIndex(self.vocabulary)
 
   def deleteEdits(self, word):
     """Returns a list of edits of 1-delete distance words and rules used to generate them."""
@@ -108,21 +187,183 @@ class EditModel(object):
       self.transposeEdits(word) + \
       self.replaceEdits(word)
 
+  def buildDeleteIndex(self, vocabulary):
+    """Maps every 1-delete variant of a vocabulary word to the (word, position) pairs
+       that produce it, so in-vocabulary inserts and replaces are found by lookup."""
+    index = collections.defaultdict(list)
+    for word in vocabulary:
+      for i in xrange(0, len(word)):
+        index[word[:i] + word[i+1:]].append((word, i))
+    return index
+
+  def vocabularyEdits(self, word, checkVocabulary=True):
+    """Yields (correction, rule) pairs for the 1-edit distance corrections of word that are in
+       the vocabulary and have an edit count, in the same order as edits(). Rules are the
+       interned keys of editCounts. Inserts and replaces come from the delete index, so they
+       are always in the vocabulary; without checkVocabulary, deletes and transposes are
+       yielded whether they are in the vocabulary or not. Every edit's rule is looked up
+       before its correction is built, so edits without a count cost no string work."""
+    vocabulary = self.vocabulary
+    if not checkVocabulary:
+      vocabulary = Everything()
+    ruleKeys = self.ruleKeys
+    marked = "<" + word
+
+    for i in xrange(1, len(marked)):
+      rule = ruleKeys.get((marked[i-1:i+1], marked[i-1]))
+      if rule is not None:
+        correction = "%s%s" % (marked[1:i], marked[i+1:])
+        if correction in vocabulary:
+          yield correction, rule
+
+    # Inserts: the misspelling is the correction with character i deleted.
+    inserts = []
+    for correction, i in self.deleteIndex.get(word, ()):
+      rule = ruleKeys.get((marked[i], marked[i] + correction[i]))
+      if rule is not None and correction[i] in EditModel.ALPHABET:
+        inserts.append((i, correction[i], correction, rule))
+    inserts.sort()
+    for entry in inserts:
+      yield entry[2], entry[3]
+
+    for i in xrange(0, len(word) - 1):
+      correctLetters = word[i+1] + word[i]
+      rule = ruleKeys.get((word[i:i+2], correctLetters))
+      if rule is not None:
+        correction = "%s%s%s" % (word[:i], correctLetters, word[i+2:])
+        if correction in vocabulary:
+          yield correction, rule
+
+    # Replaces: the misspelling and the correction agree once character i is deleted.
+    replaces = []
+    for i in xrange(0, len(word)):
+      if word[i] not in self.replaceLetters:
+        continue
+      for correction, j in self.deleteIndex.get(word[:i] + word[i+1:], ()):
+        if j == i and correction[i] != word[i] and correction[i] in EditModel.ALPHABET:
+          rule = ruleKeys.get((word[i], correction[i]))
+          if rule is not None:
+            replaces.append((i, correction[i], correction, rule))
+    replaces.sort()
+    for entry in replaces:
+      yield entry[2], entry[3]
+
   def editProbabilities(self, misspelling):
     """Computes in-vocabulary edits and edit-probabilities for a given misspelling.
-       Returns list of (correction, log(p(mispelling|correction))) pairs."""
+       Returns list of (correction, log(p(mispelling|correction))) pairs.
+       With a cache, returns a shared tuple of those pairs instead."""
+    if self.instrumentation is None:
+      return self.cachedEditProbabilities(misspelling)
+    # cache misses include every call without a cache
+    phase = 'cacheMisses'
+    if self.cacheSize > 0 and misspelling in self.cache:
+      phase = 'cacheHits'
+    start = time.time()
+    result = self.cachedEditProbabilities(misspelling)
+    self.instrumentation.seconds[phase] += time.time() - start
+    counts = self.instrumentation.counts
+    counts['words'] += 1
+    counts[phase] += 1
+    return result
+
+  def cachedEditProbabilities(self, misspelling):
+    """editProbabilities, without instrumentation."""
+    if self.cacheSize <= 0:
+      return self.computeEditProbabilities(misspelling)
+
+    if misspelling in self.cache:
+      self.cacheHits += 1
+      # move to the most recently used end
+      result = self.cache.pop(misspelling)
+      self.cache[misspelling] = result
+      return result
+
+    self.cacheMisses += 1
+    result = tuple(self.computeEditProbabilities(misspelling))
+    self.cache[misspelling] = result
+    if len(self.cache) > self.cacheSize:
+      self.cache.popitem(last=False)
+      self.cacheEvictions += 1
+    return result
 
+  def cacheStats(self):
+    """Returns a string with the hit, miss and eviction counts of the editProbabilities cache."""
+    lookups = self.cacheHits + self.cacheMisses
+    hitRate = 0.0
+    if lookups > 0:
+      hitRate = float(self.cacheHits) / lookups
+    return 'hits: %d misses: %d evictions: %d hit rate: %f' % \
+      (self.cacheHits, self.cacheMisses, self.cacheEvictions, hitRate)
+
+  def computeEditProbabilities(self, misspelling):
+    """Uncached editProbabilities."""
+    if self.deleteIndex is None:
+      raise ValueError('editProbabilities needs an EditModel built with a corpus')
+    if self.instrumentation is not None:
+      return self.instrumentedEditProbabilities(misspelling)
+    return self.normalizedEdits(misspelling, self.vocabularyEdits(misspelling))
+
+  def normalizedEdits(self, misspelling, candidates):
+    """Returns (correction, log-probability) pairs for (correction, rule) candidates."""
     wordCounts = collections.defaultdict(int)
     wordTotal  = 0
-    for edit in self.edits(misspelling):
-      if edit.editedWord != misspelling and edit.editedWord in self.vocabulary and edit.rule() in self.editCounts:
-        ruleMass = self.editCounts[edit.rule()]
+    for editedWord, rule in candidates:
+      if editedWord != misspelling:
+        ruleMass = self.editCounts[rule]
         wordTotal += ruleMass
-        wordCounts[edit.editedWord] += ruleMass
+        wordCounts[editedWord] += ruleMass
 
     #Normalize by wordTotal to make probabilities
     return [(word, math.log(float(mass) / wordTotal)) for word, mass in wordCounts.iteritems()]
 
+  def instrumentedEditProbabilities(self, misspelling):
+    """computeEditProbabilities in separately counted and timed phases: generating the edits
+       that have an edit count, keeping those in the vocabulary, and normalizing."""
+    counts = self.instrumentation.counts
+    seconds = self.instrumentation.seconds
+    start = time.time()
+    candidates = list(self.vocabularyEdits(misspelling, False))
+    generated = time.time()
+    vocabulary = self.vocabulary
+    kept = [candidate for candidate in candidates if candidate[0] in vocabulary]
+    filtered = time.time()
+    result = self.normalizedEdits(misspelling, kept)
+    seconds['generation'] += generated - start
+    seconds['filtering'] += filtered - generated
+    seconds['normalization'] += time.time() - filtered
+    counts['candidatesGenerated'] += len(candidates)
+    counts['candidatesKept'] += len(kept)
+    counts['corrections'] += len(result)
+    return result
+
+  def compoundEditProbabilities(self, misspelling, maxDistance=2):
+    """Like editProbabilities, but for every vocabulary word within maxDistance edits of the
+       misspelling, found through a VocabularyIndex instead of generating edit strings.
+       A path of edits weighs the product of its rules' shares of all edit counts, and a
+       correction the sum over its minimal paths; paths using a rule without a count are
+       dropped. Within distance one this gives the same probabilities as editProbabilities."""
+    if self.vocabularyIndex is None:
+      self.vocabularyIndex = VocabularyIndex(self.vocabulary)
+      self.ruleTotal = float(sum(self.editCounts.itervalues()))
+
+    wordCounts = collections.defaultdict(float)
+    wordTotal = 0.0
+    for correction, distance, paths in self.vocabularyIndex.search(misspelling, maxDistance):
+      if distance == 0:
+        continue
+      for path in paths:
+        mass = 1.0
+        for ruleLetters in path:
+          rule = self.ruleKeys.get(ruleLetters)
+          if rule is None:
+            break
+          mass *= self.editCounts[rule] / self.ruleTotal
+        else:
+          wordCounts[correction] += mass
+          wordTotal += mass
+
+    return [(word, math.log(mass / wordTotal)) for word, mass in wordCounts.iteritems()]
+
 # Start: Sanity checking code.
 
 def checkOverlap(edits, gold):
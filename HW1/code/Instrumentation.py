@@ -0,0 +1,126 @@
+import array
+import collections
+import math
+import time
+
+
+class Instrumentation(object):
+    """Counters, per-phase timers and per-sentence latencies for a SpellCorrect.
+
+       SpellCorrect(..., instrument=True) routes its language model through
+       InstrumentedLanguageModel and times each correctSentence call, during which its edit
+       model, which may be shared with other correctors, counts and times its own work here. Without it none of this code runs. The figures add up
+       over every sentence corrected in this process until reset() is called; sentences
+       corrected in pool workers are not counted.
+
+       The edit model counts the edits it generates with an edit count (candidatesGenerated),
+       those in the vocabulary (candidatesKept) and the distinct corrections they make, and
+       times those phases and cache hits. seconds['cacheMisses'] is the time of the uncached
+       lookups, which includes generation, filtering and normalization."""
+
+    # disjoint parts of the time spent in correctSentence
+    PHASES = ('cacheHits', 'generation', 'filtering', 'normalization', 'scoring')
+    PERCENTILES = (50, 90, 99, 100)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = collections.Counter()
+        self.seconds = collections.Counter()
+        self.latencies = array.array('d')
+
+    def timeSentences(self, correctSentence, editModel):
+        """Returns correctSentence wrapped to record the latency of every call and to hook
+           editModel to this instrumentation only for the duration of the call."""
+        def timedCorrectSentence(sentence, *args, **kwargs):
+            start = time.time()
+            previous = editModel.instrumentation
+            editModel.instrumentation = self
+            try:
+                corrected = correctSentence(sentence, *args, **kwargs)
+            finally:
+                editModel.instrumentation = previous
+            self.latencies.append(time.time() - start)
+            self.counts['sentences'] += 1
+            return corrected
+        return timedCorrectSentence
+
+    def percentile(self, p):
+        """Returns the sentence latency in seconds that p percent of sentences do not
+           exceed (nearest rank), or 0.0 before any sentence."""
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        rank = int(math.ceil(p / 100.0 * len(latencies))) - 1
+        return latencies[min(max(rank, 0), len(latencies) - 1)]
+
+    def report(self):
+        """Returns the counters, phase times and latency percentiles as a dict."""
+        total = sum(self.latencies)
+        seconds = dict((phase, self.seconds[phase]) for phase in Instrumentation.PHASES)
+        seconds['other'] = total - sum(seconds.values())
+        seconds['total'] = total
+        seconds['cacheMisses'] = self.seconds['cacheMisses']
+        return {
+            'counts': dict(self.counts),
+            'seconds': seconds,
+            'latency': dict(('p%d' % p, self.percentile(p)) for p in Instrumentation.PERCENTILES),
+        }
+
+    def __str__(self):
+        report = self.report()
+        lines = ['%s: %d' % item for item in sorted(report['counts'].items())]
+        lines += ['%s seconds: %f' % item for item in sorted(report['seconds'].items())]
+        lines += ['latency p%d: %.3f ms' % (p, 1000 * report['latency']['p%d' % p])
+                  for p in Instrumentation.PERCENTILES]
+        return '\n'.join(lines)
+
+
+class InstrumentedLanguageModel(object):
+    """A language model that counts and times its scoring calls; anything else is passed on."""
+
+    def __init__(self, languageModel, instrumentation):
+        self.languageModel = languageModel
+        self.instrumentation = instrumentation
+
+    def record(self, name, counter, amount, start):
+        """Counts a call to name that scored amount tokens or candidates (as counter)."""
+        counts = self.instrumentation.counts
+        counts[name + 'Calls'] += 1
+        counts[counter] += amount
+        self.instrumentation.seconds['scoring'] += time.time() - start
+
+    def score(self, sentence):
+        start = time.time()
+        result = self.languageModel.score(sentence)
+        self.record('score', 'tokensScored', len(sentence), start)
+        return result
+
+    def scoreBatch(self, sentences):
+        start = time.time()
+        result = self.languageModel.scoreBatch(sentences)
+        self.record('scoreBatch', 'tokensScored', sum(len(sentence) for sentence in sentences),
+                    start)
+        return result
+
+    def localScore(self, sentence, i, word):
+        start = time.time()
+        result = self.languageModel.localScore(sentence, i, word)
+        self.record('localScore', 'wordsRescored', 1, start)
+        return result
+
+    def localScoreBatch(self, sentence, positions, words):
+        start = time.time()
+        result = self.languageModel.localScoreBatch(sentence, positions, words)
+        self.record('localScoreBatch', 'wordsRescored', len(words), start)
+        return result
+
+    def tokenScore(self, *args):
+        start = time.time()
+        result = self.languageModel.tokenScore(*args)
+        self.record('tokenScore', 'tokensScored', 1, start)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.languageModel, name)
@@ -0,0 +1,361 @@
+import array
+import bisect
+import collections
+import itertools
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    # batch scoring falls back to scoring sentences one at a time
+    np = None
+
+
+# Context of the first token of every sentence, as in the bigram models
+START = " "
+
+
+class Vocabulary:
+    """Interns words as consecutive integer ids."""
+
+    def __init__(self):
+        self.ids = {}
+        self.words = []
+
+    def intern(self, word):
+        """Returns the id of word, assigning the next free id if it is new."""
+        wordId = self.ids.get(word)
+        if wordId is None:
+            wordId = len(self.words)
+            self.ids[word] = wordId
+            self.words.append(word)
+        return wordId
+
+    def getId(self, word):
+        """Returns the id of word, or -1 if it has never been interned."""
+        return self.ids.get(word, -1)
+
+    def getWord(self, wordId):
+        return self.words[wordId]
+
+    def idArray(self, words):
+        """Returns a numpy array of the ids of words. Unknown words get id len(self), so
+           tables indexed by id can keep their unknown-word entry in that last slot."""
+        unknownId = len(self.words)
+        ids = self.ids
+        return np.fromiter((ids.get(word, unknownId) for word in words), np.int64, len(words))
+
+    def batchIds(self, sentences, startId):
+        """Flattens a list of sentences into (prevIds, tokenIds, owners) numpy arrays, where
+           owners holds the index of the sentence each token belongs to and the first token
+           of every sentence follows startId."""
+        lengths = np.fromiter((len(sentence) for sentence in sentences), np.int64, len(sentences))
+        tokenIds = self.idArray([word for sentence in sentences for word in sentence])
+        prevIds = np.empty_like(tokenIds)
+        prevIds[1:] = tokenIds[:-1]
+        starts = np.cumsum(lengths) - lengths
+        prevIds[starts[lengths > 0]] = startId
+        owners = np.repeat(np.arange(len(sentences)), lengths)
+        return prevIds, tokenIds, owners
+
+    def __len__(self):
+        return len(self.words)
+
+
+class NgramStore:
+    """Unigram and bigram counts over interned word ids.
+
+       Unigram counts and the bigram type counts Kneser-Ney needs are arrays indexed by
+       word id. Bigram counts are keyed by the pair packed into one int,
+       (prevId << 32) | tokenId. Ids of unknown words are -1 and have zero counts."""
+
+    def __init__(self, corpus=None):
+        self.vocabulary = Vocabulary()
+        self.unigramCounts = array.array('l')
+        # number of distinct words seen after / before each word
+        self.followerTypeCounts = array.array('l')
+        self.continuationTypeCounts = array.array('l')
+        self.bigramCounts = {}
+        self.total = 0
+        self.unigramTypes = 0
+        # prevId -> ids of the words seen after it, kept once update() has been called
+        self.followers = None
+        self.startId = self.addWord(START)
+        if corpus:
+            self.train(corpus)
+
+    def addWord(self, word):
+        """Interns word and grows the per-word arrays to cover its id."""
+        wordId = self.vocabulary.intern(word)
+        if wordId == len(self.unigramCounts):
+            self.unigramCounts.append(0)
+            self.followerTypeCounts.append(0)
+            self.continuationTypeCounts.append(0)
+        return wordId
+
+    def train(self, corpus):
+        """Counts every sentence of a corpus."""
+        for sentence in corpus.corpus:
+            self.addSentence([datum.word for datum in sentence.data])
+
+    def addSentence(self, words):
+        """Counts the unigrams and bigrams of a list of words."""
+        prevId = self.startId
+        for word in words:
+            tokenId = self.addWord(word)
+            if self.unigramCounts[tokenId] == 0:
+                self.unigramTypes += 1
+            self.unigramCounts[tokenId] += 1
+            self.total += 1
+            key = (prevId << 32) | tokenId
+            count = self.bigramCounts.get(key, 0)
+            if count == 0:
+                self.followerTypeCounts[prevId] += 1
+                self.continuationTypeCounts[tokenId] += 1
+                if self.followers is not None:
+                    self.followers[prevId].append(tokenId)
+            self.bigramCounts[key] = count + 1
+            prevId = tokenId
+
+    def update(self, sentences):
+        """Counts more sentences (lists of words) after training. Returns the set of ids of
+           the contexts whose statistics changed: the start context and every word counted.
+           Models sharing this store refresh those contexts instead of retraining."""
+        self.thaw()
+        if self.followers is None:
+            self.followers = collections.defaultdict(list)
+            for key in self.bigramCounts:
+                prevId, tokenId = self.splitBigramKey(key)
+                self.followers[prevId].append(tokenId)
+        contexts = set([self.startId])
+        for words in sentences:
+            self.addSentence(words)
+            contexts.update(self.vocabulary.ids[word] for word in words)
+        return contexts
+
+    def freeze(self):
+        """Stores the bigram counts as a CompactTable, sorted key and count arrays instead of
+           a dict, and drops the follower index. Lookups still work; update() thaws them."""
+        if isinstance(self.bigramCounts, CompactTable):
+            return
+        self.bigramCounts = CompactTable(self.bigramCounts, typecode='l')
+        self.followers = None
+
+    def thaw(self):
+        """Copies the tables of a store restored from a snapshot, which may be read-only
+           views of the file, or frozen by freeze(), into growable arrays and a dict."""
+        if not isinstance(self.bigramCounts, CompactTable):
+            return
+        self.bigramCounts = dict(itertools.izip(self.bigramCounts.keys.tolist(),
+                                                self.bigramCounts.values.tolist()))
+        self.unigramCounts = array.array('l', self.unigramCounts.tolist())
+        self.followerTypeCounts = array.array('l', self.followerTypeCounts.tolist())
+        self.continuationTypeCounts = array.array('l', self.continuationTypeCounts.tolist())
+
+    def wordId(self, word):
+        return self.vocabulary.getId(word)
+
+    def unigramCount(self, wordId):
+        if wordId < 0:
+            return 0
+        return self.unigramCounts[wordId]
+
+    def bigramKey(self, prevId, tokenId):
+        """Returns the packed key of a bigram, or -1 (never a key) if either id is unknown."""
+        if prevId < 0 or tokenId < 0:
+            return -1
+        return (prevId << 32) | tokenId
+
+    def splitBigramKey(self, key):
+        """Returns the (prevId, tokenId) pair packed in key."""
+        return key >> 32, key & 0xFFFFFFFF
+
+    def bigramCount(self, prevId, tokenId):
+        return self.bigramCounts.get(self.bigramKey(prevId, tokenId), 0)
+
+    def followerTypeCount(self, wordId):
+        """Number of distinct words seen after wordId."""
+        if wordId < 0:
+            return 0
+        return self.followerTypeCounts[wordId]
+
+    def continuationTypeCount(self, wordId):
+        """Number of distinct words seen before wordId."""
+        if wordId < 0:
+            return 0
+        return self.continuationTypeCounts[wordId]
+
+    def bigramTypes(self):
+        return len(self.bigramCounts)
+
+    def unigramItems(self):
+        """Yields (word, count) for every word seen as a token."""
+        for wordId, count in enumerate(self.unigramCounts):
+            if count > 0:
+                yield self.vocabulary.getWord(wordId), count
+
+
+def sortedTable(table):
+    """Returns the packed keys of a bigram table as a sorted numpy array, and its values
+       as a float array in the same order, for lookupTable."""
+    if isinstance(table, CompactTable):
+        return table.sortedArrays()
+    items = sorted(table.iteritems())
+    keys = np.array([key for key, value in items], np.int64)
+    values = np.array([value for key, value in items], np.float64)
+    return keys, values
+
+
+def lookupTable(keys, values, prevIds, tokenIds):
+    """Looks up many bigrams at once in a sortedTable. Returns a boolean array marking the
+       bigrams that were found, and their values (arbitrary where not found)."""
+    queries = (prevIds << 32) | tokenIds
+    if len(keys) == 0:
+        return np.zeros(len(queries), bool), np.zeros(len(queries))
+    positions = np.searchsorted(keys, queries)
+    positions[positions == len(keys)] = 0
+    return keys[positions] == queries, values[positions]
+
+
+def pruneTable(counts, logProbs, cutoff, unseenMasses):
+    """Drops the bigrams seen at most cutoff times from logProbs, a bigram table of a model's
+       log-probabilities, so that they score as unseen bigrams. Returns the kept table and,
+       for every context that lost bigrams, the log of the factor to scale its unseen
+       probabilities by so the context keeps its total probability mass.
+       unseenMasses(prevId, seenIds, prunedIds) returns the summed unseen probability after
+       prevId of every token not in seenIds, and of the tokens in prunedIds."""
+    seen = collections.defaultdict(list)
+    pruned = collections.defaultdict(list)
+    kept = {}
+    for key, count in counts.bigramCounts.iteritems():
+        prevId, tokenId = counts.splitBigramKey(key)
+        seen[prevId].append(tokenId)
+        if count > cutoff:
+            kept[key] = logProbs[key]
+        else:
+            pruned[prevId].append(tokenId)
+    weights = {}
+    for prevId, prunedIds in pruned.iteritems():
+        prunedMass = sum(math.exp(logProbs[counts.bigramKey(prevId, tokenId)])
+                         for tokenId in prunedIds)
+        unseenMass, prunedUnseenMass = unseenMasses(prevId, seen[prevId], prunedIds)
+        weights[prevId] = math.log(unseenMass + prunedMass) - \
+            math.log(unseenMass + prunedUnseenMass)
+    return kept, weights
+
+
+def withUnknown(values, unknownValue):
+    """Returns a float numpy array of values with unknownValue appended for the unknown id."""
+    ret = np.empty(len(values) + 1)
+    ret[:-1] = values
+    ret[-1] = unknownValue
+    return ret
+
+
+class CompactTable(object):
+    """A read-only bigram table (packed key -> log-probability, or count with typecode 'l')
+       kept as a sorted array of keys and an array of values, a few bytes per entry instead
+       of a dict entry with a key and a value object. With bits 8 or 16 the values are quantized to that many bits, evenly
+       over their range, and decoded as low + step * code. Lookups bisect the keys; the table
+       supports the dict operations the models and Snapshot use. fromArrays builds one over
+       existing arrays, such as the numpy views of a mapped snapshot, without copying them."""
+
+    def __init__(self, table, bits=0, typecode='d'):
+        if bits not in (0, 8, 16):
+            raise ValueError('bits must be 0, 8 or 16, not %r' % (bits,))
+        keys = sorted(table)
+        values = [table[key] for key in keys]
+        self.keys = array.array('l', keys)
+        # step is None for unquantized values
+        self.low = self.step = None
+        if bits:
+            self.low = min(values) if values else 0.0
+            high = max(values) if values else 0.0
+            self.step = (high - self.low) / ((1 << bits) - 1) or 1.0
+            self.values = array.array('B' if bits == 8 else 'H',
+                                      [int(round((value - self.low) / self.step))
+                                       for value in values])
+        else:
+            self.values = array.array(typecode, values)
+
+    @classmethod
+    def fromArrays(cls, keys, values, low=None, step=None):
+        """Returns a table over sorted keys and their values (quantized codes if step is
+           given), as array.arrays or numpy arrays."""
+        table = cls.__new__(cls)
+        table.keys, table.values = keys, values
+        table.low, table.step = low, step
+        return table
+
+    def find(self, key):
+        """Returns the index of key, or -1 if it is not in the table."""
+        if isinstance(self.keys, array.array):
+            i = bisect.bisect_left(self.keys, key)
+        else:
+            i = int(self.keys.searchsorted(key))
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return -1
+
+    def value(self, i):
+        if self.step is None:
+            return self.values[i]
+        return self.low + self.step * self.values[i]
+
+    def get(self, key, default=None):
+        i = self.find(key)
+        if i < 0:
+            return default
+        return self.value(i)
+
+    def __getitem__(self, key):
+        i = self.find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.value(i)
+
+    def __contains__(self, key):
+        return self.find(key) >= 0
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def iteritems(self):
+        for i, key in enumerate(self.keys):
+            yield key, self.value(i)
+
+    def sortedArrays(self):
+        """Returns the keys and values as numpy arrays over this table's own memory, as
+           sortedTable does for a dict. Quantized values are decoded as they are looked up."""
+        if len(self.keys) == 0:
+            return np.zeros(0, np.int64), np.zeros(0)
+        keys, values = self.keys, self.values
+        if isinstance(keys, array.array):
+            keys = np.frombuffer(keys, np.int64)
+        if self.step is None:
+            if isinstance(values, array.array):
+                values = np.frombuffer(values, np.float64 if values.typecode == 'd' else np.int64)
+            return keys, values
+        if isinstance(values, array.array):
+            values = np.frombuffer(values, np.uint8 if values.itemsize == 1 else np.uint16)
+        return keys, QuantizedValues(values, self.low, self.step)
+
+    def memoryBytes(self):
+        """Bytes taken by the key and value arrays."""
+        return self.keys.itemsize * len(self.keys) + self.values.itemsize * len(self.values)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class QuantizedValues(object):
+    """The quantized codes of a CompactTable, decoded when indexed with an array of
+       positions, standing in for the values array of a sortedTable."""
+
+    def __init__(self, codes, low, step):
+        self.codes = codes
+        self.low = low
+        self.step = step
+
+    def __getitem__(self, positions):
+        return self.low + self.step * self.codes[positions]
@@ -1,5 +1,6 @@
-class Sentence:
+class Sentence(object):
   """Contains a list of Datums."""
+  __slots__ = ('data',)
 
   def __init__(self, sentence=[]):
     if(type(sentence) == type([])):
@@ -70,3 +71,49 @@ class Sentence:
     for datum in self.data:
       str_list.append(str(datum))
     return ' '.join(str_list)
+
+
+class SentenceView(object):
+  """A test case view of a sentence: every error corrected except the one at index.
+     Reads through to the sentence's data instead of copying it."""
+  __slots__ = ('sentence', 'index')
+
+  def __init__(self, sentence, index):
+    self.sentence = sentence
+    self.index = index
+
+  def getErrorSentence(self):
+    """Returns a list of strings with the sentence containing only the error at index."""
+    errorSentence = self.sentence.getCorrectSentence()
+    errorSentence[self.index] = self.sentence.get(self.index).error
+    return errorSentence
+
+  def getCorrectSentence(self):
+    return self.sentence.getCorrectSentence()
+
+  def isCorrection(self, candidate):
+    return self.sentence.isCorrection(candidate)
+
+  def getErrorIndex(self):
+    return self.index
+
+  def len(self):
+    return len(self.sentence)
+
+  def get(self, i):
+    datum = self.sentence.get(i)
+    if i == self.index:
+      return datum
+    return datum.fixError()
+
+  def isEmpty(self):
+    return self.sentence.isEmpty()
+
+  def __len__(self):
+    return len(self.sentence)
+
+  def __str__(self):
+    str_list = []
+    for i in range(0, len(self.sentence)):
+      str_list.append(str(self.get(i)))
+    return ' '.join(str_list)
@@ -1,55 +1,161 @@
 import math
-import collections
+import array
+from NgramStore import np, sortedTable, lookupTable, withUnknown, pruneTable
+from BigramModel import BigramModel
 
 
-class SmoothBigramModel:
+class SmoothBigramModel(BigramModel):
+    """Add-one smoothed bigram model. The add-one denominator of a context depends on the
+       number of bigram types, so bigramLogProbs holds the log numerators log(count + 1) and
+       logNormalizers the log denominator of every context; a bigram scores their
+       difference, and a new bigram type only changes logNormalizers."""
 
-    def __init__(self, corpus):
-        """Initialize your data structures in the constructor."""
-        self.unigramCounts = collections.defaultdict(lambda: 0)
-        self.bigramCounts = collections.defaultdict(lambda: 1)
-        self.total = 0
-        self.train(corpus)
+    def finalize(self):
+        """ Precomputes the log numerators of the seen bigrams and the log denominator of
+            every context, so scoring is a table lookup. Must be called again after train().
+        """
+        counts = self.counts
+        self.buildNormalizers()
+        # log numerator of an unseen bigram per context, raised by pruning
+        self.unseenLogMasses = array.array('d', [0.0]) * len(counts.unigramCounts)
+        self.bigramLogProbs = {}
+        for key, count in counts.bigramCounts.iteritems():
+            self.bigramLogProbs[key] = math.log(count + 1)
+        if self.cutoff:
+            self.pruneBigrams()
+        self.compactTable()
+
+    def buildNormalizers(self):
+        """ Sets logNormalizers, the log add-one denominator of every context, from the
+            current number of bigram types.
+        """
+        counts = self.counts
+        # add-one smoothing, with one extra bigram type standing for all unseen bigrams
+        bigramTypes = counts.bigramTypes() + 1
+        self.finalizedTypes = bigramTypes
+        self.logNormalizers = array.array('d', [math.log(count + bigramTypes)
+                                                for count in counts.unigramCounts])
+        self.unknownContextLogProb = 0.0 - math.log(bigramTypes)
+
+    def pruneBigrams(self):
+        """ Prunes the bigram table to self.cutoff, moving the probability of the pruned
+            bigrams of each context to its unseen bigrams.
+        """
+        counts = self.counts
+        vocabularySize = len(counts.unigramCounts)
+        logNormalizers = self.logNormalizers
+
+        def unseenMasses(prevId, seenIds, prunedIds):
+            unseenProb = math.exp(self.unseenLogMasses[prevId] - logNormalizers[prevId])
+            return (vocabularySize - len(seenIds)) * unseenProb, len(prunedIds) * unseenProb
+
+        logProbs = dict((key, logNumerator - logNormalizers[counts.splitBigramKey(key)[0]])
+                        for key, logNumerator in self.bigramLogProbs.iteritems())
+        kept, weights = pruneTable(counts, logProbs, self.cutoff, unseenMasses)
+        self.bigramLogProbs = dict((key, self.bigramLogProbs[key]) for key in kept)
+        for prevId, weight in weights.iteritems():
+            self.unseenLogMasses[prevId] += weight
 
-    def train(self, corpus):
-        """ Takes a corpus and trains your language model.
-            Compute any counts or other corpus statistics in this function.
+    def refreshContexts(self, contexts):
+        """ Recomputes the log numerators of the given contexts, and their log denominators,
+            or every context's when the number of bigram types changed. Log-probabilities
+            only drop outside the given contexts, so their bounds stay valid.
         """
-        for sentence in corpus.corpus:
-            prev = " "
-            for datum in sentence.data:
-                self.total += 1
-                token = datum.word
-                self.unigramCounts[token] += 1
-                bigram = "%s %s" % (prev, token)
-                self.bigramCounts[bigram] += 1
-                prev = token
-
-        self.bigramCounts["UNK"] = 1
-        self.unigramCounts["UNK"] = 0
-
-    def score(self, sentence):
-        """ Takes a list of strings as argument and returns the log-probability of the
-            sentence using your language model. Use whatever data you computed in train() here.
+        counts = self.counts
+        if counts.bigramTypes() + 1 != self.finalizedTypes:
+            self.buildNormalizers()
+            self.unknownFollowing = self.unknownContextLogProb
+        bigramTypes = self.finalizedTypes
+        # slots for the words first seen in the new text, which are all among contexts
+        for wordId in xrange(len(self.unseenLogMasses), len(counts.unigramCounts)):
+            self.unseenLogMasses.append(0.0)
+            self.maxFollowing.append(float('-inf'))
+            self.maxPreceding.append(self.unknownPreceding)
+        maxUnseen = self.unknownPreceding
+        for prevId in contexts:
+            logNormalizer = math.log(counts.unigramCounts[prevId] + bigramTypes)
+            self.logNormalizers[prevId] = logNormalizer
+            maxFollowing = self.unseenLogMasses[prevId] - logNormalizer
+            maxUnseen = max(maxUnseen, maxFollowing)
+            for tokenId in counts.followers[prevId]:
+                key = counts.bigramKey(prevId, tokenId)
+                logNumerator = math.log(counts.bigramCounts[key] + 1)
+                self.bigramLogProbs[key] = logNumerator
+                logProb = logNumerator - logNormalizer
+                maxFollowing = max(maxFollowing, logProb)
+                if logProb > self.maxPreceding[tokenId]:
+                    self.maxPreceding[tokenId] = logProb
+            self.maxFollowing[prevId] = maxFollowing
+        if maxUnseen > self.unknownPreceding:
+            self.unknownPreceding = maxUnseen
+            for tokenId in xrange(len(self.maxPreceding)):
+                self.maxPreceding[tokenId] = max(self.maxPreceding[tokenId], maxUnseen)
+
+    def unseenLogProbs(self):
+        """Returns the log-probability of an unseen bigram in every context."""
+        return [logMass - logNormalizer
+                for logMass, logNormalizer in zip(self.unseenLogMasses, self.logNormalizers)]
+
+    def buildBounds(self):
+        """ Precomputes, per word id, the highest log-probability of any token following it
+            (maxFollowing) and of it following any token (maxPreceding), for localScoreBound.
         """
-        score = 0.0
-        prev = " "
-        for token in sentence:
-            # length = len(self.bigramCounts)
-            bigram = "%s %s" % (prev, token)
-            # bigram = prev + " " + token
-            if bigram in self.bigramCounts:
-                score += math.log(self.bigramCounts[bigram])
-            else:
-                score += math.log(self.bigramCounts["UNK"])
-            if prev in self.unigramCounts:
-                score -= math.log(self.unigramCounts[prev] +
-                                  len(self.bigramCounts))
-            else:
-                score -= math.log(self.unigramCounts["UNK"] +
-                                  len(self.bigramCounts))
-            prev = token
-            # if length != len(self.bigramCounts):
-            #     print("Alert!")
-
-        return score
+        # an unseen bigram scores the unseen log-probability of its context
+        unseenLogProbs = self.unseenLogProbs()
+        maxUnseen = max(max(unseenLogProbs), self.unknownContextLogProb)
+        self.maxFollowing = array.array('d', unseenLogProbs)
+        self.maxPreceding = array.array('d', [maxUnseen]) * len(unseenLogProbs)
+        self.unknownFollowing = self.unknownContextLogProb
+        self.unknownPreceding = maxUnseen
+        counts = self.counts
+        for key, logNumerator in self.bigramLogProbs.iteritems():
+            prevId, tokenId = counts.splitBigramKey(key)
+            logProb = logNumerator - self.logNormalizers[prevId]
+            if logProb > self.maxFollowing[prevId]:
+                self.maxFollowing[prevId] = logProb
+            if logProb > self.maxPreceding[tokenId]:
+                self.maxPreceding[tokenId] = logProb
+
+    def buildBatchTables(self, sortedKeys, sortedLogProbs):
+        """Sets up the numpy tables tokenScoresBatch reads, from the bigram table as
+           sorted key and value arrays."""
+        self.sortedKeys, self.sortedLogProbs = sortedKeys, sortedLogProbs
+        # an unknown context has no seen bigrams to normalize
+        self.logNormalizerArray = withUnknown(self.logNormalizers, 0.0)
+        self.unseenLogProbArray = withUnknown(self.unseenLogProbs(), self.unknownContextLogProb)
+
+    def snapshot(self):
+        """BigramModel.snapshot, with the log denominators and unseen log numerators."""
+        meta, sections = BigramModel.snapshot(self)
+        meta['unknownContextLogProb'] = self.unknownContextLogProb
+        sections['logNormalizers'] = self.logNormalizers
+        sections['unseenLogMasses'] = self.unseenLogMasses
+        return meta, sections
+
+    def restore(self, meta, sections):
+        """BigramModel.restore, with the log denominators and unseen log numerators."""
+        self.unknownContextLogProb = meta['unknownContextLogProb']
+        self.logNormalizers = sections['logNormalizers']
+        self.unseenLogMasses = sections['unseenLogMasses']
+        BigramModel.restore(self, meta, sections)
+
+    def tokenScore(self, prev, token):
+        """Returns the log-probability term for token following prev."""
+        counts = self.counts
+        prevId = counts.wordId(prev)
+        key = counts.bigramKey(prevId, counts.wordId(token))
+        logNumerator = self.bigramLogProbs.get(key)
+        if logNumerator is None:
+            if prevId < 0:
+                return self.unknownContextLogProb
+            logNumerator = self.unseenLogMasses[prevId]
+        return logNumerator - self.logNormalizers[prevId]
+
+    def tokenScoresBatch(self, prevIds, tokenIds):
+        """Vectorized tokenScore over numpy arrays of word ids."""
+        if self.sortedKeys is None:
+            self.buildBatchTables(*sortedTable(self.bigramLogProbs))
+        found, logNumerators = lookupTable(self.sortedKeys, self.sortedLogProbs, prevIds,
+                                           tokenIds)
+        return np.where(found, logNumerators - self.logNormalizerArray[prevIds],
+                        self.unseenLogProbArray[prevIds])
@@ -1,14 +1,21 @@
 import math
 import collections
+from NgramStore import Vocabulary, np, withUnknown
+import Snapshot
 
 
-class SmoothUnigramModel:
+class SmoothUnigramModel(object):
 
-    def __init__(self, corpus):
-        """Initialize your data structures in the constructor."""
+    def __init__(self, corpus, counts=None):
+        """Initialize your data structures in the constructor.
+           With counts, an NgramStore trained on corpus, its unigram counts are used."""
         self.unigramCounts = collections.defaultdict(lambda: 1)
         self.total = 0
-        self.train(corpus)
+        if counts is None:
+            self.train(corpus)
+        else:
+            self.trainFromCounts(counts)
+        self.finalize()
 
     def train(self, corpus):
         """ Takes a corpus and trains your language model.
@@ -22,15 +29,102 @@ class SmoothUnigramModel:
         # add UNK
         self.unigramCounts["UNK"] = 1
 
+    def trainFromCounts(self, counts):
+        """Same as train, reading the counts of an NgramStore instead of a corpus."""
+        for token, count in counts.unigramItems():
+            self.unigramCounts[token] += count
+        self.total += counts.total
+        # add UNK
+        self.unigramCounts["UNK"] = 1
+
+    def update(self, sentences):
+        """ Adds the counts of sentences (lists of words) after training. Every
+            log-probability shares the smoothed total, so all of them are recomputed,
+            in one pass over the vocabulary.
+        """
+        for words in sentences:
+            for token in words:
+                self.unigramCounts[token] += 1
+                self.total += 1
+        self.finalize()
+
+    def finalize(self):
+        """ Precomputes the log-probability of every token so scoring is a table lookup.
+            Must be called again after train().
+        """
+        logTotal = math.log(self.total + len(self.unigramCounts))
+        self.logProbs = {}
+        for token, count in self.unigramCounts.iteritems():
+            self.logProbs[token] = math.log(count) - logTotal
+        self.unknownLogProb = self.logProbs["UNK"]
+        self.maxLogProb = max(self.logProbs.itervalues())
+        if np is not None:
+            self.buildBatchTables()
+
+    def buildBatchTables(self):
+        """Sets up the numpy tables the batch scorers read."""
+        self.vocabulary = Vocabulary()
+        for token in self.logProbs:
+            self.vocabulary.intern(token)
+        self.logProbArray = withUnknown([self.logProbs[token] for token in self.vocabulary.words],
+                                        self.unknownLogProb)
+
+    def snapshot(self):
+        """Returns the (meta, sections) a Snapshot file stores for this model."""
+        meta = {'total': self.total, 'unknownLogProb': self.unknownLogProb}
+        sections = {}
+        Snapshot.wordTableSections(self.unigramCounts, sections, 'unigramCounts', 'l')
+        Snapshot.wordTableSections(self.logProbs, sections, 'logProbs')
+        return meta, sections
+
+    def restore(self, meta, sections):
+        """Fills a model created without __init__ from a snapshot, instead of training."""
+        self.total = meta['total']
+        self.unknownLogProb = meta['unknownLogProb']
+        self.unigramCounts = Snapshot.restoreWordTable(
+            sections, 'unigramCounts', collections.defaultdict(lambda: 1))
+        self.logProbs = Snapshot.restoreWordTable(sections, 'logProbs', {})
+        self.maxLogProb = max(self.logProbs.itervalues())
+        if np is not None:
+            self.buildBatchTables()
+
+    def tokenScore(self, token):
+        """Returns the log-probability term contributed by a single token."""
+        return self.logProbs.get(token, self.unknownLogProb)
+
     def score(self, sentence):
         """ Takes a list of strings as argument and returns the log-probability of the
             sentence using your language model. Use whatever data you computed in train() here.
         """
         score = 0.0
         for token in sentence:
-            if token in self.unigramCounts:
-                score += math.log(self.unigramCounts[token])
-            else:
-                score += math.log(self.unigramCounts["UNK"])
-            score -= math.log(self.total + len(self.unigramCounts))
+            score += self.tokenScore(token)
         return score
+
+    def localScore(self, sentence, i, word):
+        """Returns the part of score(sentence) that depends on position i,
+           with word at position i."""
+        return self.tokenScore(word)
+
+    def localScoreBound(self, sentence, i):
+        """Returns an upper bound on localScore(sentence, i, word) over every word."""
+        return self.maxLogProb
+
+    def scoreDelta(self, sentence, i, word):
+        """Returns the change in score(sentence) when the token at position i becomes word."""
+        return self.localScore(sentence, i, word) - \
+            self.localScore(sentence, i, sentence[i])
+
+    def scoreBatch(self, sentences):
+        """Returns the scores of a list of sentences, computed in one vectorized pass when
+           numpy is available."""
+        if np is None:
+            return [self.score(sentence) for sentence in sentences]
+        prevIds, tokenIds, owners = self.vocabulary.batchIds(sentences, 0)
+        return np.bincount(owners, self.logProbArray[tokenIds], len(sentences))
+
+    def localScoreBatch(self, sentence, positions, words):
+        """Returns localScore(sentence, positions[k], words[k]) for every k."""
+        if np is None:
+            return [self.localScore(sentence, i, word) for i, word in zip(positions, words)]
+        return self.logProbArray[self.vocabulary.idArray(words)]
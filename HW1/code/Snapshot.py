@@ -0,0 +1,232 @@
+import array
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from NgramStore import NgramStore, Vocabulary, CompactTable, np
+
+# A snapshot file is MAGIC, the length of a JSON header as a little-endian uint32, the
+# header, and then the sections as flat arrays, each starting on an ALIGNMENT boundary.
+# The header holds the format version, the model's scalar fields ("meta") and, for every
+# section, its type, offset from the start of the data and item count. Loading maps the
+# file read-only; with numpy the numeric sections are views into the map, so processes
+# loading the same snapshot share its pages. Restored models read their per-word arrays and
+# bigram tables (as CompactTables) in place, and store their score bounds, so loading does
+# not depend on the number of bigrams.
+MAGIC = 'HW1SNAP\0'
+VERSION = 3
+ALIGNMENT = 8
+
+# numeric section types, as (numpy dtype, array typecode) pairs
+SECTION_TYPES = {
+    'int32': ('<i4', 'i'),
+    'int64': ('<i8', 'l'),
+    'float64': ('<f8', 'd'),
+    'uint8': ('<u1', 'B'),
+    'uint16': ('<u2', 'H'),
+}
+
+
+def sectionBytes(value):
+    """Returns (type, item count, raw bytes) for a section value: an array.array or numpy
+       array of numbers, or a list of words."""
+    if isinstance(value, list):
+        # words never contain newlines, since corpus lines are split on whitespace
+        return 'words', len(value), '\n'.join(value)
+    if np is not None and isinstance(value, np.ndarray):
+        # a section of a restored model
+        for sectionType, (dtype, typecode) in SECTION_TYPES.iteritems():
+            if value.dtype == np.dtype(dtype):
+                return sectionType, len(value), value.tostring()
+        raise ValueError('no snapshot section type for %s' % value.dtype)
+    if value.typecode in 'il' and value.itemsize == 4:
+        return 'int32', len(value), value.tostring()
+    sectionType = {'l': 'int64', 'd': 'float64', 'B': 'uint8', 'H': 'uint16'}[value.typecode]
+    return sectionType, len(value), value.tostring()
+
+
+def writeSnapshot(path, meta, sections):
+    """Writes meta (a JSON-able dict) and sections (a dict of arrays or word lists) to path."""
+    names = sorted(sections)
+    header = {'version': VERSION, 'meta': meta, 'sections': {}}
+    blobs = []
+    offset = 0
+    for name in names:
+        sectionType, count, blob = sectionBytes(sections[name])
+        header['sections'][name] = [sectionType, offset, count, len(blob)]
+        padding = -len(blob) % ALIGNMENT
+        blobs.append(blob + '\0' * padding)
+        offset += len(blob) + padding
+    headerBytes = json.dumps(header, sort_keys=True)
+    headerBytes += ' ' * (-(len(MAGIC) + 4 + len(headerBytes)) % ALIGNMENT)
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(headerBytes)))
+        f.write(headerBytes)
+        for blob in blobs:
+            f.write(blob)
+
+
+def readSnapshot(path):
+    """Returns (meta, sections) from a file written by writeSnapshot. Numeric sections are
+       numpy views into a read-only map of the file, or array.array copies without numpy."""
+    with open(path, 'rb') as f:
+        contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if contents[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not a model snapshot' % path)
+    headerLength = struct.unpack('<I', contents[len(MAGIC):len(MAGIC) + 4])[0]
+    dataStart = len(MAGIC) + 4 + headerLength
+    header = json.loads(contents[len(MAGIC) + 4:dataStart])
+    if header['version'] != VERSION:
+        raise ValueError('%s has snapshot version %d, expected %d' % (path, header['version'], VERSION))
+
+    sections = {}
+    for name, (sectionType, offset, count, size) in header['sections'].iteritems():
+        start = dataStart + offset
+        if sectionType == 'words':
+            sections[name] = contents[start:start + size].split('\n') if count else []
+        elif np is not None:
+            sections[name] = np.frombuffer(contents, SECTION_TYPES[sectionType][0], count, start)
+        else:
+            sections[name] = array.array(SECTION_TYPES[sectionType][1], contents[start:start + size])
+    return header['meta'], sections
+
+
+def storeSections(store, meta, sections, prefix='counts.'):
+    """Adds the fields of an NgramStore to a snapshot's meta and sections."""
+    meta[prefix + 'total'] = store.total
+    meta[prefix + 'unigramTypes'] = store.unigramTypes
+    meta[prefix + 'startId'] = store.startId
+    sections[prefix + 'words'] = store.vocabulary.words
+    sections[prefix + 'unigramCounts'] = store.unigramCounts
+    sections[prefix + 'followerTypeCounts'] = store.followerTypeCounts
+    sections[prefix + 'continuationTypeCounts'] = store.continuationTypeCounts
+    tableSections(store.bigramCounts, sections, prefix + 'bigramCounts', 'l')
+
+
+def restoreStore(meta, sections, prefix='counts.'):
+    """Returns the NgramStore saved by storeSections. Its arrays and bigram table are the
+       snapshot's own; update() copies them first."""
+    store = NgramStore()
+    store.vocabulary = Vocabulary()
+    store.vocabulary.words = list(sections[prefix + 'words'])
+    store.vocabulary.ids = dict(itertools.izip(store.vocabulary.words, itertools.count()))
+    store.unigramCounts = sections[prefix + 'unigramCounts']
+    store.followerTypeCounts = sections[prefix + 'followerTypeCounts']
+    store.continuationTypeCounts = sections[prefix + 'continuationTypeCounts']
+    store.bigramCounts = restoreTable(sections, prefix + 'bigramCounts')
+    store.total = meta[prefix + 'total']
+    store.unigramTypes = meta[prefix + 'unigramTypes']
+    store.startId = meta[prefix + 'startId']
+    return store
+
+
+def tableSections(table, sections, name, typecode='d'):
+    """Adds a bigram table (a dict keyed by packed bigram keys, or a CompactTable) as two
+       sections, its sorted keys and the values in the same order. A quantized table keeps
+       its codes, with its low and step in a third section."""
+    if isinstance(table, CompactTable):
+        sections[name + '.keys'] = table.keys
+        sections[name + '.values'] = table.values
+        if table.step is not None:
+            sections[name + '.quantization'] = array.array('d', [table.low, table.step])
+        return
+    keys = sorted(table)
+    sections[name + '.keys'] = array.array('l', keys)
+    sections[name + '.values'] = array.array(typecode, [table[key] for key in keys])
+
+
+def restoreTable(sections, name):
+    """Returns a CompactTable over the key and value arrays of a table saved by
+       tableSections, without copying them."""
+    quantization = ()
+    if name + '.quantization' in sections:
+        quantization = [float(value) for value in sections[name + '.quantization']]
+    return CompactTable.fromArrays(sections[name + '.keys'], sections[name + '.values'],
+                                   *quantization)
+
+
+def boundSections(model, meta, sections):
+    """Adds the localScoreBound tables of a bigram model to a snapshot's meta and sections."""
+    meta['unknownFollowing'] = model.unknownFollowing
+    meta['unknownPreceding'] = model.unknownPreceding
+    sections['maxFollowing'] = model.maxFollowing
+    sections['maxPreceding'] = model.maxPreceding
+
+
+def restoreBounds(model, meta, sections):
+    """Sets the localScoreBound tables saved by boundSections on model."""
+    model.unknownFollowing = meta['unknownFollowing']
+    model.unknownPreceding = meta['unknownPreceding']
+    model.maxFollowing = sections['maxFollowing']
+    model.maxPreceding = sections['maxPreceding']
+
+
+def wordTableSections(table, sections, name, typecode='d'):
+    """Adds a dict keyed by word as a word list section and a values section."""
+    words = sorted(table)
+    sections[name + '.words'] = words
+    sections[name + '.values'] = array.array(typecode, [table[word] for word in words])
+
+
+def restoreWordTable(sections, name, table):
+    """Fills table (a dict, possibly a defaultdict) from a wordTableSections table."""
+    table.update(itertools.izip(sections[name + '.words'], sections[name + '.values'].tolist()))
+    return table
+
+
+def saveModel(model, path):
+    """Writes a language model or EditModel to a snapshot file."""
+    meta, sections = model.snapshot()
+    meta['class'] = model.__class__.__name__
+    writeSnapshot(path, meta, sections)
+
+
+def loadModel(path):
+    """Returns the model saved in a snapshot file, without retraining it."""
+    meta, sections = readSnapshot(path)
+    # every model lives in the module of the same name
+    className = str(meta['class'])
+    cls = getattr(__import__(className), className)
+    model = cls.__new__(cls)
+    model.restore(meta, sections)
+    return model
+
+
+def main():
+    """Trains every language model and the edit model and writes them as snapshots."""
+    if len(sys.argv) != 3:
+        print 'usage: python Snapshot.py <training corpus> <output directory>'
+        sys.exit(1)
+    from Corpus import Corpus
+    from EditModel import EditModel
+    from UniformModel import UniformModel
+    from UnigramModel import UnigramModel
+    from SmoothUnigramModel import SmoothUnigramModel
+    from SmoothBigramModel import SmoothBigramModel
+    from BackoffModel import BackoffModel
+    from CustomModel import CustomModel
+
+    trainPath, outputDir = sys.argv[1:]
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+    trainingCorpus = Corpus(trainPath)
+    counts = NgramStore(trainingCorpus)
+    models = [EditModel('data/count_1edit.txt', trainingCorpus)]
+    for cls in [UniformModel, UnigramModel, SmoothUnigramModel, SmoothBigramModel,
+                BackoffModel, CustomModel]:
+        models.append(cls(trainingCorpus, counts))
+    for model in models:
+        path = os.path.join(outputDir, model.__class__.__name__ + '.snap')
+        saveModel(model, path)
+        start = time.time()
+        loadModel(path)
+        print '%s: %d bytes, loads in %.1f ms' % (path, os.path.getsize(path),
+                                                   1000 * (time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,79 +14,294 @@ from BackoffModel import BackoffModel
 from SmoothUnigramModel import SmoothUnigramModel
 from SmoothBigramModel import SmoothBigramModel
 from CustomModel import CustomModel
+from BigramModel import BigramModel
 from EditModel import EditModel
+from NgramStore import NgramStore, START
 from SpellingResult import SpellingResult
+from Instrumentation import Instrumentation, InstrumentedLanguageModel
 import types
 import re
 import collections
+import multiprocessing
+import json
+import heapq
+import StringIO
 # import copy
 
+# The corrector pool workers use. It is set before the pool forks, so the workers share
+# the trained models with the parent instead of receiving a pickled copy per task.
+workerSpeller = None
+
+
+def correctInWorker(testCase):
+    return testCase, workerSpeller.correctSentence(testCase.getErrorSentence())
+
 
 class SpellCorrect:
     """Spelling corrector for sentences. Holds edit model, language model and the corpus."""
 
-    def __init__(self, lm, corpus):
+    TIE_TOLERANCE = 1e-9
+    CHUNK_SIZE = 16  # sentences handed to a pool worker at a time
+
+    def __init__(self, lm, corpus, cacheSize=0, batchScoring=False, workers=1, editModel=None,
+                 multiError=False, beamWidth=0, errorRate=0.05, instrument=False, maxPositions=0,
+                 branchAndBound=True):
+        """cacheSize bounds the LRU cache of edit probabilities per misspelling; 0 disables it.
+           With batchScoring, all candidates in a sentence are scored in one
+           localScoreBatch call to the language model (see correctSentenceBatch). With workers > 1, evaluate and
+           correctCorpus fan sentences out to that many forked processes.
+           editModel is an optional EditModel shared with other correctors, used instead of
+           building one (and cacheSize) from corpus.
+           With multiError, sentences may have any number of errors and are corrected by
+           correctSentenceLattice, which needs a bigram language model; beamWidth and
+           errorRate are its parameters.
+           With instrument, self.instrumentation counts candidates and scoring calls and
+           times them and every sentence; otherwise it is None and costs nothing. A shared
+           editModel only counts its lookups for this corrector while correcting for it.
+           With maxPositions > 0, correctSentence only tries candidates at that many of the
+           most suspicious positions of each sentence (see suspectPositions).
+           With branchAndBound, candidates whose upper bound cannot beat the best score so
+           far are not scored; the result is the same as without it."""
+        if multiError and not isinstance(lm, BigramModel):
+            raise ValueError('multiError needs a bigram language model, not %s' %
+                             lm.__class__.__name__)
         self.languageModel = lm
-        self.editModel = EditModel('data/count_1edit.txt', corpus)
+        self.batchScoring = batchScoring
+        self.workers = workers
+        self.multiError = multiError
+        self.beamWidth = beamWidth
+        self.errorRate = errorRate
+        self.maxPositions = maxPositions
+        self.branchAndBound = branchAndBound
+        if editModel is None:
+            editModel = EditModel('data/count_1edit.txt', corpus, cacheSize)
+        self.editModel = editModel
+        self.instrumentation = None
+        if instrument:
+            self.instrumentation = Instrumentation()
+            self.languageModel = InstrumentedLanguageModel(lm, self.instrumentation)
+            self.correctSentence = self.instrumentation.timeSentences(self.correctSentence,
+                                                                      editModel)
 
-    def correctSentence(self, sentence):
+    def correctSentence(self, sentence, maxPositions=None):
         """Assuming exactly one error per sentence, returns the most probable corrected sentence.
-           Sentence is a list of words."""
+           Sentence is a list of words. maxPositions overrides self.maxPositions; 0 searches
+           every position."""
 
         if len(sentence) == 0:
             return []
+        if self.multiError:
+            return self.correctSentenceLattice(sentence)
 
         bestSentence = sentence[:]  # copy of sentence
         bestScore = float('-inf')
+        bestIndex = -1
+        bestWord = None
 
         # TODO: select the maximum probability sentence here, according to the noisy channel model.
         # Tip: self.editModel.editProbabilities(word) gives edits and log-probabilities according to your edit model.
         #      You should iterate through these values instead of enumerating all edits.
         # Tip: self.languageModel.score(trialSentence) gives log-probability of a sentence
 
-        for i in xrange(1, len(sentence) - 1):  # ignore <s> and </s>
+        # Only the terms around position i change when word i is replaced, so score the
+        # sentence once and rescore just that window for every candidate.
+        baseScore = self.languageModel.score(sentence)
+        # the terms of baseScore that depend on each position, in one left-to-right pass
+        originalScores = [0.0] + [self.languageModel.localScore(sentence, i, sentence[i])
+                                  for i in xrange(1, len(sentence) - 1)]
+        positions = xrange(1, len(sentence) - 1)  # ignore <s> and </s>
+        if maxPositions is None:
+            maxPositions = self.maxPositions
+        if 0 < maxPositions < len(sentence) - 2:
+            positions = self.suspectPositions(sentence, originalScores, maxPositions)
+        if self.batchScoring:
+            return self.correctSentenceBatch(sentence, positions, baseScore, originalScores)
+        for i in positions:
             originalWord = sentence[i]
+            # score of the sentence without the terms that depend on position i
+            restScore = baseScore - originalScores[i]
             allEdits = self.editModel.editProbabilities(originalWord)
+            if self.branchAndBound:
+                # An in-vocabulary candidate scores at most its edit log-probability plus
+                # restBound (rounding is monotone, so also in floating point). Those that
+                # could not beat the best score so far, which only grows, are dropped.
+                restBound = restScore + self.languageModel.localScoreBound(sentence, i)
+                allEdits = [edit for edit in allEdits
+                            if edit[1] + restBound - bestScore > SpellCorrect.TIE_TOLERANCE
+                            or edit[0] not in self.editModel.vocabulary]
             # iterate through all possible edits
             for edit in allEdits:
                 curEditWord = edit[0]
                 score = edit[1]
                 # if the new word is not in the vocabulary, it is very unlikely it will be the best fit
                 if curEditWord in self.editModel.vocabulary:
-                    sentence[i] = curEditWord
-                    score += self.languageModel.score(sentence)
-                if bestScore < score:
+                    if self.branchAndBound and \
+                            score + restBound - bestScore <= SpellCorrect.TIE_TOLERANCE:
+                        continue
+                    score += restScore + self.languageModel.localScore(sentence, i, curEditWord)
+                # window rescoring rounds differently per position, so scores within
+                # TIE_TOLERANCE are ties and the first candidate wins
+                if score - bestScore > SpellCorrect.TIE_TOLERANCE:
                     bestScore = score
-                    bestSentence = sentence[:]
-            sentence[i] = originalWord
+                    bestIndex = i
+                    bestWord = curEditWord
+        if bestIndex >= 0:
+            bestSentence[bestIndex] = bestWord
         return bestSentence
 
-    def evaluate(self, corpus):
-        """Tests this speller on a corpus, returns a SpellingResult"""
+    def correctSentenceBatch(self, sentence, positions, baseScore, originalScores):
+        """The rest of correctSentence with batchScoring: the in-vocabulary candidates at
+           every position are scored in a single localScoreBatch call, so none are pruned
+           by bounds. Picks the same sentence as the scalar search."""
+        vocabulary = self.editModel.vocabulary
+        # (position, candidate, edit log-probability) in the order the scalar search visits
+        edits = [(i, edit[0], edit[1]) for i in positions
+                 for edit in self.editModel.editProbabilities(sentence[i])]
+        scored = [edit for edit in edits if edit[1] in vocabulary]
+        localScores = self.languageModel.localScoreBatch(
+            sentence, [edit[0] for edit in scored], [edit[1] for edit in scored])
+        if hasattr(localScores, 'tolist'):
+            localScores = localScores.tolist()
+        localScores = iter(localScores)
+        bestSentence = sentence[:]
+        bestScore = float('-inf')
+        bestEdit = None
+        for i, word, score in edits:
+            if word in vocabulary:
+                score += baseScore - originalScores[i] + next(localScores)
+            if score - bestScore > SpellCorrect.TIE_TOLERANCE:
+                bestScore = score
+                bestEdit = (i, word)
+        if bestEdit is not None:
+            bestSentence[bestEdit[0]] = bestEdit[1]
+        return bestSentence
+
+    def suspectPositions(self, sentence, originalScores, k):
+        """Returns, in sentence order, the k positions most likely to hold the error: words
+           outside the vocabulary first, then the words with the highest surprisal (lowest
+           originalScores entry, the log-probability of the terms around them)."""
+        vocabulary = self.editModel.vocabulary
+        ranked = sorted(xrange(1, len(sentence) - 1),
+                        key=lambda i: (sentence[i] in vocabulary, originalScores[i]))
+        return sorted(ranked[:k])
+
+    def correctSentenceLattice(self, sentence):
+        """Returns the most probable corrected sentence, allowing any number of errors.
+           Position i of the lattice holds the word itself and its editProbabilities
+           candidates (<s> and </s> are fixed), and Viterbi search finds the best path under
+           the bigram language model. Keeping a word costs log(1 - errorRate) and
+           replacing it log(errorRate) plus the edit log-probability. With beamWidth > 0
+           only that many best paths survive each position, so the cost is linear in the
+           sentence length; with 0 the search is exact."""
+        lm = self.languageModel
+        keepScore = math.log(1 - self.errorRate)
+        editScore = math.log(self.errorRate)
+        last = len(sentence) - 1
+        # paths through the lattice so far as (score, word, path), where path is the
+        # chosen words as nested (word, previous path) pairs
+        beam = [(0.0, START, None)]
+        for i, word in enumerate(sentence):
+            if i == 0 or i == last:
+                candidates = [(word, 0.0)]
+            else:
+                candidates = [(word, keepScore)]
+                for edit in self.editModel.editProbabilities(word):
+                    candidates.append((edit[0], editScore + edit[1]))
+            nextBeam = []
+            for candidate, channelScore in candidates:
+                bestScore = float('-inf')
+                bestPath = None
+                for score, prev, path in beam:
+                    score += lm.tokenScore(prev, candidate)
+                    if score - bestScore > SpellCorrect.TIE_TOLERANCE:
+                        bestScore = score
+                        bestPath = path
+                nextBeam.append((bestScore + channelScore, candidate, (candidate, bestPath)))
+            if self.beamWidth > 0 and len(nextBeam) > self.beamWidth:
+                nextBeam = heapq.nlargest(self.beamWidth, nextBeam, key=lambda entry: entry[0])
+            beam = nextBeam
+
+        bestPath = max(beam, key=lambda entry: entry[0])[2]
+        corrected = []
+        while bestPath is not None:
+            corrected.append(bestPath[0])
+            bestPath = bestPath[1]
+        corrected.reverse()
+        return corrected
+
+    def correctSentences(self, testCases):
+        """Yields (testCase, hypothesis) for each test case (a Sentence) in order, where
+           hypothesis is correctSentence of its error sentence. The test cases are read once,
+           so a lazy stream is not held in memory by this method. With workers > 1 they are
+           corrected in a pool of forked processes, which hand each test case back with its
+           hypothesis; their edit caches are their own, so cacheStats only counts work done
+           in this process."""
+        if self.workers <= 1:
+            for testCase in testCases:
+                yield testCase, self.correctSentence(testCase.getErrorSentence())
+            return
+
+        global workerSpeller
+        workerSpeller = self
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            for result in pool.imap(correctInWorker, testCases, SpellCorrect.CHUNK_SIZE):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            workerSpeller = None
+
+    def evaluate(self, corpus, comparePruning=False):
+        """Tests this speller on a corpus, returns a SpellingResult. With comparePruning and
+           maxPositions > 0, every test sentence is also corrected by searching all positions,
+           and the result counts the sentences where pruning changed the answer."""
         numCorrect = 0
         numTotal = 0
-        testData = corpus.generateTestCases()
-        for sentence in testData:
-            if sentence.isEmpty():
-                continue
-            errorSentence = sentence.getErrorSentence()
-            hypothesis = self.correctSentence(errorSentence)
+        numPruningChanged = None
+        if comparePruning and self.maxPositions > 0 and not self.multiError:
+            numPruningChanged = 0
+        testCases = (sentence for sentence in corpus.iterTestCases() if not sentence.isEmpty())
+        for sentence, hypothesis in self.correctSentences(testCases):
             if sentence.isCorrection(hypothesis):
                 numCorrect += 1
             numTotal += 1
-        return SpellingResult(numCorrect, numTotal)
+            if numPruningChanged is not None and \
+                    hypothesis != SpellCorrect.correctSentence(self, sentence.getErrorSentence(), 0):
+                numPruningChanged += 1
+        return SpellingResult(numCorrect, numTotal, self.instrumentation, numPruningChanged)
 
     def correctCorpus(self, corpus):
         """Corrects a whole corpus, returns a JSON representation of the output."""
-        string_list = []  # we will join these with commas,  bookended with []
-        sentences = corpus.corpus
-        for sentence in sentences:
-            uncorrected = sentence.getErrorSentence()
-            corrected = self.correctSentence(uncorrected)
-            word_list = '["%s"]' % '","'.join(corrected)
-            string_list.append(word_list)
-        output = '[%s]' % ','.join(string_list)
-        return output
+        output = StringIO.StringIO()
+        self.writeCorpus(corpus, output)
+        return output.getvalue()
+
+    def writeCorpus(self, corpus, output, flushEvery=0):
+        """Corrects a whole corpus and writes the same JSON as correctCorpus to the file-like
+           output, one sentence at a time as it is corrected, so only the sentences in flight
+           are held in memory. With flushEvery > 0, output is flushed after every flushEvery
+           sentences. Returns the number of sentences written. Tokens are written as their
+           bytes, whatever their encoding, so the output is in the corpus's encoding."""
+        output.write('[')
+        numWritten = 0
+        for sentence, corrected in self.correctSentences(corpus.corpus):
+            if numWritten:
+                output.write(',')
+            # writes the token bytes through instead of decoding them as UTF-8
+            output.write(json.dumps(corrected, separators=(',', ':'), ensure_ascii=False))
+            numWritten += 1
+            if flushEvery and numWritten % flushEvery == 0:
+                output.flush()
+        output.write(']')
+        if flushEvery:
+            output.flush()
+        return numWritten
+
+    def cacheStats(self):
+        """Returns the edit probability cache counters as a string."""
+        return self.editModel.cacheStats()
 
 
 def main():
@@ -99,42 +314,50 @@ def main():
     devPath = 'data/tagged-dev.dat'
     devCorpus = Corpus(devPath)
 
+    # Count the training corpus once and share the counts and the edit model (with its
+    # edit probability cache) between all the language models and correctors.
+    counts = NgramStore(trainingCorpus)
+    cacheSize = 10000  # misspellings kept in the edit probability cache
+    editModel = EditModel('data/count_1edit.txt', trainingCorpus, cacheSize)
+
     print 'Unigram Language Model: '
-    unigramLM = UnigramModel(trainingCorpus)
-    unigramSpell = SpellCorrect(unigramLM, trainingCorpus)
+    unigramLM = UnigramModel(trainingCorpus, counts)
+    unigramSpell = SpellCorrect(unigramLM, trainingCorpus, editModel=editModel)
     unigramOutcome = unigramSpell.evaluate(devCorpus)
     print str(unigramOutcome)
 
     print 'Uniform Language Model: '
-    uniformLM = UniformModel(trainingCorpus)
-    uniformSpell = SpellCorrect(uniformLM, trainingCorpus)
+    uniformLM = UniformModel(trainingCorpus, counts)
+    uniformSpell = SpellCorrect(uniformLM, trainingCorpus, editModel=editModel)
     uniformOutcome = uniformSpell.evaluate(devCorpus)
     print str(uniformOutcome)
 
     print 'Smooth Unigram Language Model: '
-    smoothUnigramLM = SmoothUnigramModel(trainingCorpus)
-    smoothUnigramSpell = SpellCorrect(smoothUnigramLM, trainingCorpus)
+    smoothUnigramLM = SmoothUnigramModel(trainingCorpus, counts)
+    smoothUnigramSpell = SpellCorrect(smoothUnigramLM, trainingCorpus, editModel=editModel)
     smoothUnigramOutcome = smoothUnigramSpell.evaluate(devCorpus)
     print str(smoothUnigramOutcome)
 
     print 'Smooth Bigram Language Model: '
-    smoothBigramLM = SmoothBigramModel(trainingCorpus)
-    smoothBigramSpell = SpellCorrect(smoothBigramLM, trainingCorpus)
+    smoothBigramLM = SmoothBigramModel(trainingCorpus, counts)
+    smoothBigramSpell = SpellCorrect(smoothBigramLM, trainingCorpus, editModel=editModel)
     smoothBigramOutcome = smoothBigramSpell.evaluate(devCorpus)
     print str(smoothBigramOutcome)
 
     print 'Backoff Language Model: '
-    backoffLM = BackoffModel(trainingCorpus)
-    backoffSpell = SpellCorrect(backoffLM, trainingCorpus)
+    backoffLM = BackoffModel(trainingCorpus, counts)
+    backoffSpell = SpellCorrect(backoffLM, trainingCorpus, editModel=editModel)
     backoffOutcome = backoffSpell.evaluate(devCorpus)
     print str(backoffOutcome)
 
     print 'Custom Language Model: '
-    customLM = CustomModel(trainingCorpus)
-    customSpell = SpellCorrect(customLM, trainingCorpus)
+    customLM = CustomModel(trainingCorpus, counts)
+    customSpell = SpellCorrect(customLM, trainingCorpus, editModel=editModel)
     customOutcome = customSpell.evaluate(devCorpus)
     print str(customOutcome)
 
+    print 'Edit cache: ' + editModel.cacheStats()
+
 
 if __name__ == "__main__":
     main()
@@ -6,9 +6,13 @@ class SpellingResult:
     self.numCorrect = 0
     self.numTotal = 0
 
-  def __init__(self, correct, total):
+  def __init__(self, correct, total, instrumentation=None, pruningChanged=None):
     self.numCorrect = correct
     self.numTotal = total
+    # the corrector's Instrumentation, if it was instrumented
+    self.instrumentation = instrumentation
+    # sentences where position pruning changed the answer, if that was compared
+    self.numPruningChanged = pruningChanged
   
   def getAccuracy(self):
     if self.numTotal == 0:
@@ -17,4 +21,7 @@ class SpellingResult:
       return float(self.numCorrect) / self.numTotal
 
   def __str__(self):
-    return 'correct: %d total: %d accuracy: %f' % (self.numCorrect, self.numTotal, self.getAccuracy())
+    ret = 'correct: %d total: %d accuracy: %f' % (self.numCorrect, self.numTotal, self.getAccuracy())
+    if self.numPruningChanged is not None:
+      ret += ' pruning changed: %d' % self.numPruningChanged
+    return ret
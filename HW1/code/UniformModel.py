@@ -1,12 +1,17 @@
 import math, collections
+import Snapshot
 
-class UniformModel:
+class UniformModel(object):
   """Language model that uses uniform probabilities for all words."""
 
-  def __init__(self, corpus):
-    """Initialize your data structures in the constructor."""
+  def __init__(self, corpus, counts=None):
+    """Initialize your data structures in the constructor.
+       With counts, an NgramStore trained on corpus, the words are taken from it."""
     self.words = set([])
-    self.train(corpus)
+    if counts is None:
+      self.train(corpus)
+    else:
+      self.trainFromCounts(counts)
 
   def train(self, corpus):
     """ Takes a corpus and trains your language model.
@@ -17,6 +22,24 @@ class UniformModel:
         word = datum.word # get the word
         self.words.add(word)
 
+  def trainFromCounts(self, counts):
+    """Same as train, reading the words of an NgramStore instead of a corpus."""
+    for word, count in counts.unigramItems():
+      self.words.add(word)
+
+  def update(self, sentences):
+    """Adds the words of sentences (lists of words) after training."""
+    for words in sentences:
+      self.words.update(words)
+
+  def snapshot(self):
+    """Returns the (meta, sections) a Snapshot file stores for this model."""
+    return {}, {'words': sorted(self.words)}
+
+  def restore(self, meta, sections):
+    """Fills a model created without __init__ from a snapshot, instead of training."""
+    self.words = set(sections['words'])
+
   def score(self, sentence):
     """ Takes a list of strings as argument and returns the log-probability of the
         sentence using your language model. Use whatever data you computed in train() here.
@@ -29,3 +52,22 @@ class UniformModel:
     # we show the 'for' loop for insructive purposes.
     return score
 
+  def localScore(self, sentence, i, word):
+    """Returns the part of score(sentence) that depends on position i, with word at position i."""
+    return math.log(1.0/len(self.words))
+
+  def localScoreBound(self, sentence, i):
+    """Returns an upper bound on localScore(sentence, i, word) over every word."""
+    return math.log(1.0/len(self.words))
+
+  def scoreDelta(self, sentence, i, word):
+    """Returns the change in score(sentence) when the token at position i becomes word."""
+    return self.localScore(sentence, i, word) - self.localScore(sentence, i, sentence[i])
+
+  def scoreBatch(self, sentences):
+    """Returns the scores of a list of sentences."""
+    return [self.score(sentence) for sentence in sentences]
+
+  def localScoreBatch(self, sentence, positions, words):
+    """Returns localScore(sentence, positions[k], words[k]) for every k."""
+    return [self.localScore(sentence, i, word) for i, word in zip(positions, words)]
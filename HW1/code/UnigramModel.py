@@ -1,12 +1,18 @@
 import math, collections
+import Snapshot
 
-class UnigramModel:
+class UnigramModel(object):
   """Language model that uses unigram probabilities, ignoring unseen words."""
 
-  def __init__(self, corpus):
+  def __init__(self, corpus, counts=None):
+    """Counts the words of corpus, or copies the unigram counts of counts, an NgramStore
+       trained on corpus (see BigramModel)."""
     self.unigramCounts = collections.defaultdict(lambda: 0)
     self.total = 0
-    self.train(corpus)
+    if counts is None:
+      self.train(corpus)
+    else:
+      self.trainFromCounts(counts)
 
   def train(self, corpus):
     """Takes a HolbrookCorpus corpus, does whatever training is needed."""
@@ -15,14 +21,66 @@ class UnigramModel:
         token = datum.word
         self.unigramCounts[token] = self.unigramCounts[token] + 1
         self.total += 1
-  
+
+  def trainFromCounts(self, counts):
+    """Same as train, reading the counts of an NgramStore instead of a corpus."""
+    for token, count in counts.unigramItems():
+      self.unigramCounts[token] += count
+    self.total += counts.total
+
+  def update(self, sentences):
+    """Adds the counts of sentences (lists of words) after training."""
+    for words in sentences:
+      for token in words:
+        self.unigramCounts[token] += 1
+        self.total += 1
+
+  def snapshot(self):
+    """Returns the (meta, sections) a Snapshot file stores for this model."""
+    sections = {}
+    Snapshot.wordTableSections(self.unigramCounts, sections, 'unigramCounts', 'l')
+    return {'total': self.total}, sections
+
+  def restore(self, meta, sections):
+    """Fills a model created without __init__ from a snapshot, instead of training."""
+    self.total = meta['total']
+    self.unigramCounts = Snapshot.restoreWordTable(
+      sections, 'unigramCounts', collections.defaultdict(lambda: 0))
+
+  def tokenScore(self, token):
+    """Returns the log-probability term contributed by a single token."""
+    score = 0.0
+    count = self.unigramCounts[token]
+    if count > 0:
+      score += math.log(count)
+      score -= math.log(self.total)
+    #Ignore unseen words
+    return score
+
   def score(self, sentence):
     """Takes a list of strings, returns a score of that sentence."""
     score = 0.0 
     for token in sentence:
-      count = self.unigramCounts[token]
-      if count > 0:
-        score += math.log(count)
-        score -= math.log(self.total)
-      #Ignore unseen words
+      score += self.tokenScore(token)
     return score
+
+  def localScore(self, sentence, i, word):
+    """Returns the part of score(sentence) that depends on position i, with word at position i."""
+    return self.tokenScore(word)
+
+  def localScoreBound(self, sentence, i):
+    """Returns an upper bound on localScore(sentence, i, word) over every word."""
+    # unseen words score 0.0, above any seen word
+    return 0.0
+
+  def scoreDelta(self, sentence, i, word):
+    """Returns the change in score(sentence) when the token at position i becomes word."""
+    return self.localScore(sentence, i, word) - self.localScore(sentence, i, sentence[i])
+
+  def scoreBatch(self, sentences):
+    """Returns the scores of a list of sentences."""
+    return [self.score(sentence) for sentence in sentences]
+
+  def localScoreBatch(self, sentence, positions, words):
+    """Returns localScore(sentence, positions[k], words[k]) for every k."""
+    return [self.localScore(sentence, i, word) for i, word in zip(positions, words)]
@@ -0,0 +1,100 @@
+class VocabularyIndex(object):
+    """A trie over a vocabulary for finding every word within a few edits of a misspelling.
+
+       search walks the trie with one row of the Damerau-Levenshtein table (restricted to
+       adjacent transpositions, like levenshtein in Datum) per trie depth, so words sharing
+       a prefix share its rows, and skips any subtree once all cells of its row exceed the
+       distance bound. Edit paths use the rule format of count_1edit.txt."""
+
+    def __init__(self, vocabulary=()):
+        # nested dicts of characters; the None key of a node holds the word ending there
+        self.root = {}
+        self.size = 0
+        for word in vocabulary:
+            self.add(word)
+
+    def add(self, word):
+        """Adds word to the index."""
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        if None not in node:
+            node[None] = word
+            self.size += 1
+
+    def search(self, word, maxDistance):
+        """Returns (correction, distance, paths) for every indexed word within maxDistance of
+           word, sorted by correction. paths lists every distinct minimal edit path turning
+           the correction into word, each a tuple of (corruptLetters, correctLetters) rules
+           from left to right."""
+        results = []
+        self.searchNode(self.root, word, maxDistance, [range(len(word) + 1)], [], results)
+        results.sort()
+        return results
+
+    def searchNode(self, node, word, maxDistance, rows, prefix, results):
+        """Extends the search below node, where rows holds the table rows of prefix."""
+        for char, child in node.iteritems():
+            if char is None:
+                continue
+            prefix.append(char)
+            rows.append(self.nextRow(word, rows, prefix))
+            row = rows[-1]
+            if row[-1] <= maxDistance and None in child:
+                results.append((child[None], row[-1], self.editPaths(word, rows, prefix)))
+            if min(row) <= maxDistance:
+                self.searchNode(child, word, maxDistance, rows, prefix, results)
+            rows.pop()
+            prefix.pop()
+
+    def nextRow(self, word, rows, prefix):
+        """Returns the table row of prefix, whose last character is new, against word."""
+        depth = len(prefix)
+        char = prefix[-1]
+        above = rows[-1]
+        row = [depth]
+        for j in xrange(1, len(word) + 1):
+            cost = above[j - 1] + (char != word[j - 1])
+            if above[j] + 1 < cost:
+                cost = above[j] + 1
+            if row[j - 1] + 1 < cost:
+                cost = row[j - 1] + 1
+            # transpositions
+            if (depth > 1 and j > 1 and char == word[j - 2] and prefix[-2] == word[j - 1]
+                and char != word[j - 1] and rows[-2][j - 2] + 1 < cost):
+                cost = rows[-2][j - 2] + 1
+            row.append(cost)
+        return row
+
+    def editPaths(self, word, rows, prefix):
+        """Backtraces the table to every minimal edit path from prefix to word."""
+        def paths(d, j):
+            if d == 0 and j == 0:
+                return [()]
+            cost = rows[d][j]
+            ret = []
+            if d > 0 and j > 0 and rows[d - 1][j - 1] + (prefix[d - 1] != word[j - 1]) == cost:
+                step = ()
+                if prefix[d - 1] != word[j - 1]:
+                    step = ((word[j - 1], prefix[d - 1]),)
+                ret.extend(path + step for path in paths(d - 1, j - 1))
+            if (d > 1 and j > 1 and prefix[d - 1] == word[j - 2] and prefix[d - 2] == word[j - 1]
+                and prefix[d - 1] != word[j - 1] and rows[d - 2][j - 2] + 1 == cost):
+                step = ((word[j - 2:j], prefix[d - 2] + prefix[d - 1]),)
+                ret.extend(path + step for path in paths(d - 2, j - 2))
+            if j > 0 and rows[d][j - 1] + 1 == cost:
+                # word has an extra character; the rule includes the one before it
+                context = word[j - 2] if j > 1 else '<'
+                step = ((context + word[j - 1], context),)
+                ret.extend(path + step for path in paths(d, j - 1))
+            if d > 0 and rows[d - 1][j] + 1 == cost:
+                # word lacks a character of prefix, after its character j - 1
+                context = word[j - 1] if j > 0 else '<'
+                step = ((context, context + prefix[d - 1]),)
+                ret.extend(path + step for path in paths(d - 1, j))
+            return ret
+
+        return sorted(set(paths(len(prefix), len(word))))
+
+    def __len__(self):
+        return self.size